@@ -1,4 +1,5 @@
 import os
+import tempfile
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
@@ -12,6 +13,11 @@ def get_app_setting(app_setting):
         raise ImproperlyConfigured(error_msg)
 
 
+def get_optional_app_setting(app_setting, default):
+    """ Get the application setting or return the default """
+    return getattr(settings, app_setting, default)
+
+
 def get_env_setting(setting):
     """ Get the environment setting or return exception """
     try:
@@ -21,15 +27,116 @@ def get_env_setting(setting):
         raise ImproperlyConfigured(error_msg)
 
 
-BDR_BASE = get_app_setting("BDR_BASE")
-REORDER_URL = '%s/api/private/reorder/' % BDR_BASE
-THUMBNAIL_BASE_URL = '%s/viewers/image/thumbnail' % BDR_BASE
-STORAGE_BASE_URL = f'{BDR_BASE}/storage/'
-STUDIO_ITEM_URL = '%s/studio/item' % BDR_BASE
-ITEM_POST_URL = get_app_setting("ITEM_POST_URL")
-FOLDER_API_PUBLIC = get_app_setting("FOLDER_API_PUBLIC")
-LIBRARY_PARENT_FOLDER_ID = get_app_setting("LIBRARY_PARENT_FOLDER_ID")
-DEFAULT_RIGHTS_CHOICES = get_app_setting("DEFAULT_RIGHTS_CHOICES")
+#required settings are looked up the first time they're used (see __getattr__ below),
+#  so importing the app - eg. for a management command - doesn't need them all
+_LAZY_SETTINGS = {
+    'BDR_BASE': lambda: get_app_setting("BDR_BASE"),
+    'REORDER_URL': lambda: '%s/api/private/reorder/' % get_app_setting("BDR_BASE"),
+    'THUMBNAIL_BASE_URL': lambda: '%s/viewers/image/thumbnail' % get_app_setting("BDR_BASE"),
+    'STORAGE_BASE_URL': lambda: f'{get_app_setting("BDR_BASE")}/storage/',
+    'STUDIO_ITEM_URL': lambda: '%s/studio/item' % get_app_setting("BDR_BASE"),
+    'ITEM_POST_URL': lambda: get_app_setting("ITEM_POST_URL"),
+    'FOLDER_API_PUBLIC': lambda: get_app_setting("FOLDER_API_PUBLIC"),
+    'LIBRARY_PARENT_FOLDER_ID': lambda: get_app_setting("LIBRARY_PARENT_FOLDER_ID"),
+    'DEFAULT_RIGHTS_CHOICES': lambda: get_app_setting("DEFAULT_RIGHTS_CHOICES"),
+}
+
+
+def __getattr__(name):
+    try:
+        load_setting = _LAZY_SETTINGS[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = load_setting()
+    globals()[name] = value
+    return value
+
+
+#pooled HTTP client for the item, storage & folder APIs
+HTTP_POOL_SIZE = get_optional_app_setting("REPO_DIRECT_HTTP_POOL_SIZE", 10)
+HTTP_CONNECT_TIMEOUT = get_optional_app_setting("REPO_DIRECT_HTTP_CONNECT_TIMEOUT", 5)
+HTTP_READ_TIMEOUT = get_optional_app_setting("REPO_DIRECT_HTTP_READ_TIMEOUT", 120)
+UPLOAD_CHUNK_SIZE = get_optional_app_setting("REPO_DIRECT_UPLOAD_CHUNK_SIZE", 64 * 1024)
+DOWNLOAD_CHUNK_SIZE = get_optional_app_setting("REPO_DIRECT_DOWNLOAD_CHUNK_SIZE", 64 * 1024)
+
+#per-upstream circuit breaker: it opens when, of the last BREAKER_WINDOW calls (at least
+#  BREAKER_MIN_CALLS), the share that failed (5xx or no response) reaches BREAKER_ERROR_RATE or the
+#  share slower than BREAKER_SLOW_CALL_SECONDS reaches BREAKER_SLOW_RATE. Calls then fail fast for
+#  BREAKER_OPEN_SECONDS, after which one probe call decides whether it closes again.
+BREAKER_WINDOW = get_optional_app_setting("REPO_DIRECT_BREAKER_WINDOW", 20)
+BREAKER_MIN_CALLS = get_optional_app_setting("REPO_DIRECT_BREAKER_MIN_CALLS", 5)
+BREAKER_ERROR_RATE = get_optional_app_setting("REPO_DIRECT_BREAKER_ERROR_RATE", 0.5)
+BREAKER_SLOW_CALL_SECONDS = get_optional_app_setting("REPO_DIRECT_BREAKER_SLOW_CALL_SECONDS", 30)
+BREAKER_SLOW_RATE = get_optional_app_setting("REPO_DIRECT_BREAKER_SLOW_RATE", 0.5)
+BREAKER_OPEN_SECONDS = get_optional_app_setting("REPO_DIRECT_BREAKER_OPEN_SECONDS", 30)
+
+#retries for idempotent calls (after connection errors, timeouts & 502/503/504) - the wait before
+#  retry n is random, up to HTTP_RETRY_BACKOFF * 2**n seconds (but no more than HTTP_RETRY_MAX_BACKOFF)
+HTTP_RETRIES = get_optional_app_setting("REPO_DIRECT_HTTP_RETRIES", 2)
+HTTP_RETRY_BACKOFF = get_optional_app_setting("REPO_DIRECT_HTTP_RETRY_BACKOFF", 0.5)
+HTTP_RETRY_MAX_BACKOFF = get_optional_app_setting("REPO_DIRECT_HTTP_RETRY_MAX_BACKOFF", 5)
+
+#send every child's position on reorder, instead of just the ones that moved
+REORDER_SEND_FULL_ORDER = get_optional_app_setting("REPO_DIRECT_REORDER_SEND_FULL_ORDER", False)
+#RELS-EXT predicate holding a child's order (BDR's bul-rel:hasPagination) - the current orders are read
+#  from Fedora's resource index with it, so only the moved children are sent. If they can't be read, or
+#  don't match the children (eg. a different predicate), the full order is sent; None always sends it
+REORDER_ORDER_PREDICATE = get_optional_app_setting("REPO_DIRECT_REORDER_ORDER_PREDICATE", 'http://library.brown.edu/#hasPagination')
+
+BULK_MAX_WORKERS = get_optional_app_setting("REPO_DIRECT_BULK_MAX_WORKERS", 8)
+
+#threads (per process) for a view's independent upstream fetches
+UPSTREAM_FETCH_WORKERS = get_optional_app_setting("REPO_DIRECT_UPSTREAM_FETCH_WORKERS", 16)
+
+#streaming derivative job tracking - the status URL gets formatted with the pid, and
+#  should return JSON like {"status": "running", "detail": "..."}
+STREAM_JOB_STATUS_URL = get_optional_app_setting("REPO_DIRECT_STREAM_JOB_STATUS_URL", None)
+STREAM_JOB_POLL_INTERVAL = get_optional_app_setting("REPO_DIRECT_STREAM_JOB_POLL_INTERVAL", 60)
+STREAM_JOB_EXPIRY = get_optional_app_setting("REPO_DIRECT_STREAM_JOB_EXPIRY", 6 * 60 * 60)
+#without a status URL nothing says when a job is done, so it refuses resubmission for the pid
+#  (unless "submit anyway" is checked) for this long, and is then expired
+STREAM_JOB_DEDUPE_SECONDS = get_optional_app_setting("REPO_DIRECT_STREAM_JOB_DEDUPE_SECONDS", 60 * 60)
+
+#local disk cache for the reorder page's thumbnails (sizes in bytes, times in seconds)
+THUMBNAIL_CACHE_DIR = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_CACHE_DIR", os.path.join(tempfile.gettempdir(), 'repo_direct_thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_CACHE_MAX_BYTES", 500 * 1024 * 1024)
+THUMBNAIL_CACHE_REVALIDATE_AFTER = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_CACHE_REVALIDATE_AFTER", 24 * 60 * 60)
+THUMBNAIL_CACHE_EVICT_EVERY = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_CACHE_EVICT_EVERY", 50)
+THUMBNAIL_MISSING_CACHE_SECONDS = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_MISSING_CACHE_SECONDS", 10 * 60)
+THUMBNAIL_BROWSER_MAX_AGE = get_optional_app_setting("REPO_DIRECT_THUMBNAIL_BROWSER_MAX_AGE", 7 * 24 * 60 * 60)
+
+#XML datastreams bigger than this (bytes) open read-only, loaded a chunk at a time
+XML_EDIT_MAX_INLINE_SIZE = get_optional_app_setting("REPO_DIRECT_XML_EDIT_MAX_INLINE_SIZE", 2 * 1024 * 1024)
+
+#edited XML up to this many bytes is sent straight from memory, larger XML goes through a temp file
+XML_EDIT_MAX_IN_MEMORY_SIZE = get_optional_app_setting("REPO_DIRECT_XML_EDIT_MAX_IN_MEMORY_SIZE", 10 * 1024 * 1024)
+XML_VIEW_CHUNK_SIZE = get_optional_app_setting("REPO_DIRECT_XML_VIEW_CHUNK_SIZE", 256 * 1024)
+XML_PRETTY_CACHE_TIMEOUT = get_optional_app_setting("REPO_DIRECT_XML_PRETTY_CACHE_TIMEOUT", 24 * 60 * 60)
+
+#versions per page on the datastream history page
+HISTORY_PAGE_SIZE = get_optional_app_setting("REPO_DIRECT_HISTORY_PAGE_SIZE", 25)
+#how long browsers may keep an old datastream version (asOfDateTime) - it doesn't change, so this can be long
+RAW_DATASTREAM_VERSION_MAX_AGE = get_optional_app_setting("REPO_DIRECT_RAW_DATASTREAM_VERSION_MAX_AGE", 30 * 24 * 60 * 60)
+
+#XSD (or .rng RelaxNG) schema paths/URLs to validate edited XML against, by dsid - eg.
+#  {'MODS': '/path/to/mods-3-7.xsd'}. Prefer local copies: they're read once per process.
+XML_SCHEMAS = get_optional_app_setting("REPO_DIRECT_XML_SCHEMAS", {})
+
+#per-object cache of profiles, RELS-EXT & irMetadata (seconds) - writes through repo_direct clear it
+OBJECT_CACHE_TIMEOUT = get_optional_app_setting("REPO_DIRECT_OBJECT_CACHE_TIMEOUT", 10 * 60)
+
+#token Prometheus sends (as "Authorization: Bearer <token>") to scrape the upstream metrics endpoint -
+#  without it, only logged-in staff can see the metrics
+METRICS_TOKEN = get_optional_app_setting("REPO_DIRECT_METRICS_TOKEN", None)
+
+#SQLite file for the landing page's pid/title lookup - somewhere persistent in production
+SEARCH_INDEX_PATH = get_optional_app_setting("REPO_DIRECT_SEARCH_INDEX_PATH", os.path.join(tempfile.gettempdir(), 'repo_direct_search.sqlite3'))
+SEARCH_RESULTS_LIMIT = get_optional_app_setting("REPO_DIRECT_SEARCH_RESULTS_LIMIT", 10)
+
+#process-wide cache of folder API info (seconds)
+COLLECTION_CACHE_TTL = get_optional_app_setting("REPO_DIRECT_COLLECTION_CACHE_TTL", 300)
+COLLECTION_CACHE_MAX_STALE = get_optional_app_setting("REPO_DIRECT_COLLECTION_CACHE_MAX_STALE", 3600)
+COLLECTION_CACHE_MAX_SIZE = get_optional_app_setting("REPO_DIRECT_COLLECTION_CACHE_MAX_SIZE", 256)
 
 XML_DSIDS = [
     'MODS',
@@ -0,0 +1,51 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import app_settings as settings
+from . import metrics
+
+
+def run_bulk(func, jobs, max_workers=None):
+    """Run func(*args) for each (key, args) job on a bounded thread pool.
+
+    Yields (key, error) as each job finishes - error is None on success, or the
+    exception message. Jobs that haven't started are cancelled if the caller stops
+    iterating (eg. the client went away). The jobs' upstream calls are labelled
+    with the view that called run_bulk, even though the results are usually
+    iterated after it has returned.
+    """
+    return _run_jobs(func, jobs, max_workers or settings.BULK_MAX_WORKERS, metrics.current_view())
+
+
+def _run_jobs(func, jobs, max_workers, view):
+    def call(*args):
+        with metrics.view_context(view):
+            return func(*args)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    try:
+        for key, args in jobs:
+            futures[executor.submit(call, *args)] = key
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], (str(error) if error is not None else None)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def parse_pid_rows(pids_text='', csv_file=None):
+    """Return [(pid, value_or_None)] from a textarea of pids (one per line or
+    comma/space separated) and/or a CSV file of pid[,value] rows."""
+    rows = []
+    for pid in pids_text.replace(',', ' ').split():
+        rows.append((pid.strip(), None))
+    if csv_file is not None:
+        lines = csv_file.read().decode('utf-8-sig').splitlines()
+        for row in csv.reader(lines):
+            if not row or not row[0].strip() or row[0].strip().lower() == 'pid':
+                continue
+            value = row[1].strip() if len(row) > 1 and row[1].strip() else None
+            rows.append((row[0].strip(), value))
+    return rows
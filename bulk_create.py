@@ -0,0 +1,167 @@
+"""Create new objects from the rows of a CSV (title, collection_id, mods).
+
+Every row is recorded in a BulkCreateRow before anything is posted, keyed by the
+batch (by default, a hash of the CSV) and row number, so running the same CSV
+again picks up where it stopped: created rows are reported with their pid, failed
+rows are retried. A row whose post was cut off (eg. the process died) may or may
+not have created an object, so it's reported rather than posted again, unless
+retry_interrupted is given - that way a resume never creates duplicates. Each
+row is claimed in the database just before it's posted, so two runs of the same
+batch at once don't post a row twice either.
+"""
+import csv
+import hashlib
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bdrcommon.identity import BDR_ADMIN
+from django.utils import timezone
+
+from . import app_settings as settings
+from . import http_client
+from . import search_index
+from .models import BulkCreateRow
+
+
+logger = logging.getLogger('ingest')
+
+CSV_COLUMNS = ['title', 'collection_id', 'mods']
+REPORT_COLUMNS = ['row', 'title', 'result', 'pid', 'error']
+
+
+def batch_id_for(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def parse_create_rows(content):
+    """[(row_number, title, collection_id, mods)] from CSV bytes - the header row is
+    optional, and the columns are title[,collection_id[,mods]]"""
+    rows = []
+    for row_number, row in enumerate(csv.reader(content.decode('utf-8-sig').splitlines(keepends=True)), start=1):
+        row = [value.strip() for value in row] + [''] * (len(CSV_COLUMNS) - len(row))
+        title, collection_id, mods = row[:len(CSV_COLUMNS)]
+        if [title.lower(), collection_id.lower()] == CSV_COLUMNS[:2] or not any(row):
+            continue
+        if not title and not mods:
+            raise ValueError(f'row {row_number}: a title or MODS is needed')
+        if collection_id:
+            if not collection_id.isdigit():
+                raise ValueError(f'row {row_number}: invalid collection id "{collection_id}"')
+            collection_id = int(collection_id)
+        rows.append((row_number, title, collection_id or None, mods))
+    return rows
+
+
+def post_new_object(title, collection_id=None, mods=None):
+    """Create an object through the item API - returns the new pid. Used for single
+    objects (the new object form) as well as batches."""
+    params = {}
+    if mods:
+        params['mods'] = json.dumps({'xml_data': mods})
+    else:
+        params['mods'] = json.dumps({'parameters': {'title': title}})
+    params['ir'] = json.dumps({'parameters': {'ir_collection_id': collection_id}})
+    params['rights'] = json.dumps({'parameters': {'owner_id': BDR_ADMIN}})
+    r = http_client.item_api_post(params)
+    if r.ok:
+        return r.json()['pid']
+    else:
+        raise Exception(f'error posting new object: {r.status_code} - {r.content.decode("utf8")}')
+
+
+def register_rows(batch, rows, submitter):
+    """Record any rows of the batch that aren't already recorded; returns all its rows.
+
+    Rows another run of the batch recorded first are left as they are.
+    """
+    BulkCreateRow.objects.bulk_create([
+            BulkCreateRow(batch=batch, row_number=row_number, title=title, collection_id=collection_id, mods=mods or '', submitter=submitter)
+            for row_number, title, collection_id, mods in rows
+        ], ignore_conflicts=True)
+    return list(BulkCreateRow.objects.filter(batch=batch))
+
+
+def _claim(row):
+    """Mark row as posting, if it's still as it was read - False if another run of
+    the batch got to it first"""
+    claimed = BulkCreateRow.objects.filter(pk=row.pk, status=row.status).update(status=BulkCreateRow.POSTING, updated=timezone.now())
+    if not claimed:
+        return False
+    row.status = BulkCreateRow.POSTING
+    return True
+
+
+def _record_result(row, future):
+    error = future.exception()
+    if error is None:
+        row.status = BulkCreateRow.CREATED
+        row.pid = future.result()
+        row.error = ''
+        search_index.index_object(row.pid, title=row.title or None, collection_ids=[row.collection_id] if row.collection_id else [])
+    else:
+        row.status = BulkCreateRow.FAILED
+        row.error = str(error)
+    row.save()
+    return row
+
+
+def _post_rows(rows, max_workers):
+    """Post rows on a bounded pool, yielding (row, result) as each post finishes.
+
+    A row is claimed (marked as posting) just before it's submitted, and skipped if
+    another run claimed it first. Every database write happens in this thread - the
+    workers only talk to the item API. Posts that are under way if the caller stops
+    iterating are waited for and recorded, and the rest aren't started.
+    """
+    pending = iter(rows)
+    in_flight = {}
+    skipped = []
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def start_next():
+        for row in pending:
+            if _claim(row):
+                in_flight[executor.submit(post_new_object, row.title, row.collection_id, row.mods)] = row
+                return
+            row.error = 'another run of this batch is posting this row'
+            skipped.append(row)
+
+    try:
+        for _ in range(max_workers):
+            start_next()
+        while True:
+            while skipped:
+                yield skipped.pop(0), 'skipped'
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                row = _record_result(in_flight.pop(future), future)
+                start_next()
+                yield row, ('created' if row.status == BulkCreateRow.CREATED else 'failed')
+    finally:
+        executor.shutdown(wait=True)
+        for future, row in in_flight.items():
+            _record_result(row, future)
+
+
+def run_batch(batch, rows, submitter, retry_interrupted=False, max_workers=None):
+    """Create the batch's objects, yielding (row, result) as each row is done - result
+    is 'created', 'already created', 'failed', 'interrupted', or 'skipped' if another
+    run of the batch is posting the row"""
+    to_post = []
+    for row in register_rows(batch, rows, submitter):
+        if row.status == BulkCreateRow.CREATED:
+            yield row, 'already created'
+        elif row.status == BulkCreateRow.POSTING and not retry_interrupted:
+            row.error = 'interrupted while posting - check whether the object was created before retrying this row'
+            yield row, 'interrupted'
+        else:
+            to_post.append(row)
+    logger.info(f'{submitter} bulk creating {len(to_post)} objects in batch {batch}')
+    yield from _post_rows(to_post, max_workers or settings.BULK_MAX_WORKERS)
+
+
+def report_row(row, result):
+    return [row.row_number, row.title, result, row.pid, row.error]
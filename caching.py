@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger('ingest')
+
+
+class TTLCache(object):
+    """Bounded, thread-safe, process-wide LRU cache with a time-to-live per entry.
+
+    Entries older than ttl are still returned (stale-while-revalidate) while one
+    background thread per key reloads them; entries older than ttl + max_stale
+    are reloaded synchronously. If a background reload raises, the stale entry
+    is kept and the error is logged. A load that started before an invalidate()
+    or clear() isn't stored, so it can't put the old value back.
+    """
+
+    def __init__(self, max_size, ttl, max_stale=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._generation = 0 #bumped by invalidate() & clear()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            return self._load(key, loader)
+        value, loaded_at = entry
+        age = time.monotonic() - loaded_at
+        if age <= self.ttl:
+            return value
+        if self.max_stale is not None and age > self.ttl + self.max_stale:
+            return self._load(key, loader)
+        self._refresh_in_background(key, loader)
+        return value
+
+    def set(self, key, value, generation=None):
+        """Store value - unless generation is given and the cache has been invalidated since"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def _load(self, key, loader):
+        with self._lock:
+            generation = self._generation
+        value = loader()
+        self.set(key, value, generation=generation)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        thread = threading.Thread(target=self._refresh, args=(key, loader), daemon=True)
+        thread.start()
+
+    def _refresh(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception:
+            logger.exception(f'error refreshing cached value for {key}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
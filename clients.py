@@ -0,0 +1,46 @@
+"""Fedora & BDR API clients, created on first use.
+
+Each thread gets its own clients (their requests sessions aren't meant to be shared
+between threads), and a forked process starts over with new ones, so a preloaded
+master never shares sockets with its workers. eulfedora & bdrcommon are only
+imported when a client is first needed.
+"""
+import os
+import threading
+
+from . import app_settings as settings
+from . import metrics
+
+
+_local = threading.local()
+
+
+def _thread_client(name, build):
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.clients = {}
+        _local.pid = os.getpid()
+    if name not in _local.clients:
+        _local.clients[name] = build()
+    return _local.clients[name]
+
+
+def _build_repo():
+    from eulfedora.server import Repository
+    repo = Repository()
+    metrics.instrument_fedora(repo)
+    return repo
+
+
+def _build_bdr_server():
+    from bdrcommon.resources import BDRResources
+    return BDRResources(settings.BDR_BASE)
+
+
+def get_repo():
+    """This thread's eulfedora Repository"""
+    return _thread_client('repo', _build_repo)
+
+
+def get_bdr_server():
+    """This thread's BDRResources client"""
+    return _thread_client('bdr_server', _build_bdr_server)
@@ -0,0 +1,62 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from lxml import etree
+
+
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+FEDORA_MODEL_NS = 'info:fedora/fedora-system:def/model#'
+
+AUDIO_VIDEO = 'audio_video'
+IMPLICIT_SET = 'implicit_set'
+IMAGE = 'image'
+
+#which content models give an object each capability - add new categories here
+CAPABILITY_MODELS = {
+    AUDIO_VIDEO: frozenset(f'info:fedora/bdr-cmodel:{name}' for name in [
+        'audio', 'video', 'audioMaster', 'aiff', 'wav', 'mp3', 'mp4', 'm4v', 'mov',
+    ]),
+    IMPLICIT_SET: frozenset(['info:fedora/bdr-cmodel:implicit-set']),
+    IMAGE: frozenset(f'info:fedora/bdr-cmodel:{name}' for name in [
+        'image', 'masterImage', 'jp2', 'jpg', 'png', 'tiff',
+    ]),
+}
+
+CLASSIFICATION_CACHE_SIZE = 1024
+_classifications = OrderedDict()
+_classifications_lock = threading.Lock()
+
+
+def parse_content_models(pid, rels_ext_xml):
+    """The content model URIs an object's RELS-EXT says it has, as a frozenset"""
+    if not rels_ext_xml:
+        return frozenset()
+    subject = f'info:fedora/{pid}'
+    root = etree.fromstring(rels_ext_xml)
+    models = set()
+    for description in root.iter(f'{{{RDF_NS}}}Description'):
+        if description.get(f'{{{RDF_NS}}}about') != subject:
+            continue
+        for has_model in description.iter(f'{{{FEDORA_MODEL_NS}}}hasModel'):
+            models.add(has_model.get(f'{{{RDF_NS}}}resource'))
+    return frozenset(models)
+
+
+def classify(models):
+    """The capabilities (AUDIO_VIDEO, IMPLICIT_SET, ...) a set of content models gives"""
+    return frozenset(capability for capability, capability_models in CAPABILITY_MODELS.items() if models & capability_models)
+
+
+def get_capabilities(pid, rels_ext_xml):
+    """classify() an object's RELS-EXT, remembering the result by pid & RELS-EXT checksum"""
+    key = (pid, hashlib.md5(rels_ext_xml).hexdigest())
+    with _classifications_lock:
+        if key in _classifications:
+            _classifications.move_to_end(key)
+            return _classifications[key]
+    capabilities = classify(parse_content_models(pid, rels_ext_xml))
+    with _classifications_lock:
+        _classifications[key] = capabilities
+        while len(_classifications) > CLASSIFICATION_CACHE_SIZE:
+            _classifications.popitem(last=False)
+    return capabilities
@@ -0,0 +1,87 @@
+"""ZIP export of an object's datastreams, built as it's sent.
+
+zipfile can write to a stream it can't seek (each entry's sizes & CRC go in a data
+descriptor after its content), so the archive goes out through a small buffer
+that's emptied after every write - memory use doesn't depend on the size of the
+object, and nothing is staged on disk.
+"""
+import hashlib
+import mimetypes
+import time
+import zipfile
+
+from .object_data import has_usable_checksum
+
+MANIFEST_NAME = 'manifest-sha256.txt'
+FEDORA_CHECKSUMS_NAME = 'fedora-checksums.txt'
+
+
+class _WriteBuffer:
+    """Unseekable file-like object zipfile writes to - drain() takes what's been written"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def entry_name(profile):
+    """File name in the archive for a datastream, with an extension from its mimetype"""
+    extension = mimetypes.guess_extension(profile.mimetype or '') or ''
+    if extension and profile.dsid.lower().endswith(extension):
+        extension = ''
+    return f'{profile.dsid}{extension}'
+
+
+def _date_time(profile):
+    try:
+        created = time.strptime((profile.created or '')[:19], '%Y-%m-%dT%H:%M:%S')
+        return created[:6]
+    except ValueError:
+        return time.localtime()[:6]
+
+
+def _fedora_checksum(profile):
+    if has_usable_checksum(profile):
+        return f'{profile.checksum_type}\t{profile.checksum}'
+    return 'DISABLED\tnone'
+
+
+def stream_zip(entries):
+    """Yield a ZIP archive of (profile, content chunks) entries, followed by two manifests:
+    the SHA-256 of each file as it was sent (in sha256sum -c format), and the checksum
+    Fedora has on record for it.
+
+    If an entry's content raises, so does this, without finishing the archive -
+    what was sent isn't a readable ZIP, so a failed export can't pass for a
+    complete one.
+    """
+    buffer = _WriteBuffer()
+    manifest = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for profile, chunks in entries:
+            name = entry_name(profile)
+            sha256 = hashlib.sha256()
+            with archive.open(zipfile.ZipInfo(name, date_time=_date_time(profile)), 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            manifest.append((name, sha256.hexdigest(), profile))
+        archive.writestr(MANIFEST_NAME, ''.join(f'{digest}  {name}\n' for name, digest, profile in manifest))
+        archive.writestr(FEDORA_CHECKSUMS_NAME, ''.join(
+                f'{name}\t{_fedora_checksum(profile)}\n' for name, digest, profile in manifest
+            ))
+    yield buffer.drain()
@@ -2,15 +2,13 @@ from django import forms
 from django.forms.widgets import CheckboxSelectMultiple, HiddenInput
 from django.contrib.admin.widgets import AdminFileWidget
 
-import requests
-from eulxml.xmlmap import load_xmlobject_from_string
-from bdrxml import irMetadata
 from bdrcommon.identity import BDR_ACCESS
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
 from django_ace import AceWidget
 
-from . import app_settings as settings
+from .object_data import get_collection_ids
+from .validation import validate_xml
 
 
 class FileReplacementForm( forms.Form ):
@@ -33,10 +31,25 @@ class EditXMLForm(forms.Form, CommonFormHelperMixin):
 
     xml_content = forms.CharField(widget=AceWidget(mode='xml', width="100%", height="500px"))
 
+    def __init__(self, *args, **kwargs):
+        self.dsid = kwargs.pop('dsid', None)
+        super().__init__(*args, **kwargs)
+
+    def clean_xml_content(self):
+        xml_content = self.cleaned_data['xml_content']
+        errors = validate_xml(self.dsid, xml_content)
+        if errors:
+            raise forms.ValidationError(errors)
+        return xml_content
+
 
 class RepoLandingForm(forms.Form):
 
-    pid = forms.CharField(error_messages={'required': 'Please enter a pid'})
+    pid = forms.CharField(
+            error_messages={'required': 'Please enter a pid'},
+            widget=forms.TextInput(attrs={'list': 'pid-suggestions', 'autocomplete': 'off'}),
+            help_text='or start typing a title or collection id',
+        )
 
 
 class ItemCollectionsForm(forms.Form):
@@ -45,11 +58,7 @@ class ItemCollectionsForm(forms.Form):
 
     @staticmethod
     def from_storage_data(pid):
-        r = requests.get(f'{settings.STORAGE_BASE_URL}{pid}/irMetadata/')
-        if not r.ok:
-            raise Exception(f'{r.status_code} - {r.text}')
-        ir_obj = load_xmlobject_from_string(r.content, irMetadata.IR)
-        return ItemCollectionsForm({'collection_ids': ','.join(ir_obj.collection_list)})
+        return ItemCollectionsForm({'collection_ids': ','.join(get_collection_ids(pid))})
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -74,6 +83,8 @@ class CreateStreamForm(forms.Form):
 
     visibility = forms.ChoiceField(choices=( (BDR_ACCESS.brown_only.name, 'Brown Only'), (BDR_ACCESS.public.name, 'Public') ),
             help_text='If you need other visibility options, please contact the BDR team.')
+    submit_anyway = forms.BooleanField(required=False,
+            help_text='Queue a new job even if one for this object is already in progress.')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -109,3 +120,39 @@ class NewObjectForm(forms.Form):
 class ReorderForm(forms.Form):
     child_pids_ordered_list = forms.CharField(required=True, widget=HiddenInput)
 
+
+class BulkCreateForm(forms.Form):
+
+    csv_file = forms.FileField(label='CSV file', help_text='Rows of title[,collection_id[,MODS XML]] - with a MODS column, the title comes from the MODS. Uploading the same file again resumes it.')
+    retry_interrupted = forms.BooleanField(required=False, help_text='Also post rows that were cut off last time (they may already have been created).')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_class = 'col-md-6 col-md-offset-3'
+        self.helper.add_input(Submit('submit', 'Create Objects'))
+
+
+class BulkEditForm(forms.Form):
+
+    ACTION_CHOICES = (
+        ('embargo', 'Set embargo end year'),
+        ('collections', 'Set collection IDs'),
+    )
+
+    action = forms.ChoiceField(choices=ACTION_CHOICES)
+    value = forms.CharField(required=False, help_text='Embargo end year, or collection IDs separated by "," - a value in the second CSV column overrides this for that pid.')
+    pids = forms.CharField(required=False, widget=forms.Textarea, help_text='One pid per line.')
+    pids_file = forms.FileField(required=False, label='CSV file', help_text='Rows of pid[,value].')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_class = 'col-md-6 col-md-offset-3'
+        self.helper.add_input(Submit('submit', 'Run Bulk Edit'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('pids') and not cleaned_data.get('pids_file'):
+            raise forms.ValidationError('Please enter pids or upload a CSV file.')
+        return cleaned_data
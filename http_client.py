@@ -0,0 +1,239 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import app_settings as settings
+from . import metrics
+
+
+_adapter = None
+_adapter_pid = None
+_adapter_lock = threading.Lock()
+_local = threading.local()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_breakers = {}
+_breakers_pid = None
+_breakers_lock = threading.Lock()
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class BackendDegraded(Exception):
+    """upstream's circuit breaker is open, so the call wasn't made"""
+
+    def __init__(self, upstream, retry_after):
+        self.upstream = upstream
+        self.retry_after = retry_after
+        super().__init__(f'{upstream} is degraded - not sending it requests for the next {retry_after:.0f}s')
+
+
+class CircuitBreaker(object):
+    """Fail fast while an upstream is failing or slow, instead of tying up workers.
+
+    Closed, it counts failed & slow calls over the last BREAKER_WINDOW calls and opens
+    when either share reaches its threshold. Open, every call is refused for
+    BREAKER_OPEN_SECONDS. Then it's half-open: one probe call is let through (others
+    are still refused), and its outcome closes or re-opens the breaker.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=settings.BREAKER_WINDOW) #(failed, slow) per call
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise BackendDegraded if the call shouldn't be made"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + settings.BREAKER_OPEN_SECONDS - time.monotonic()
+                if remaining > 0:
+                    raise BackendDegraded(self.upstream, remaining)
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    raise BackendDegraded(self.upstream, settings.BREAKER_OPEN_SECONDS)
+                self.probing = True
+
+    def record(self, failed, seconds):
+        slow = seconds > settings.BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                self.probing = False
+            elif self.state == self.CLOSED:
+                self.outcomes.append((failed, slow))
+                calls = len(self.outcomes)
+                if calls >= settings.BREAKER_MIN_CALLS:
+                    failures = sum(1 for failed, slow in self.outcomes if failed)
+                    slow_calls = sum(1 for failed, slow in self.outcomes if slow)
+                    if failures / calls >= settings.BREAKER_ERROR_RATE or slow_calls / calls >= settings.BREAKER_SLOW_RATE:
+                        self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+
+def get_adapter():
+    """Return this process's transport adapter - its connection pools are thread-safe,
+    so every thread's session shares them.
+
+    A forked worker gets its own adapter (and connection pools) the first time it
+    makes a request, so sockets are never shared with the parent process.
+    """
+    global _adapter, _adapter_pid
+    if _adapter is None or _adapter_pid != os.getpid():
+        with _adapter_lock:
+            if _adapter is None or _adapter_pid != os.getpid():
+                _adapter = HTTPAdapter(pool_connections=settings.HTTP_POOL_SIZE, pool_maxsize=settings.HTTP_POOL_SIZE)
+                _adapter_pid = os.getpid()
+    return _adapter
+
+
+def get_session():
+    """Return this thread's keep-alive session.
+
+    Like the Fedora & BDR clients, a requests Session (its cookies, headers etc.)
+    isn't shared between threads - but they all send through the process's adapter,
+    so keep-alive connections are pooled across threads.
+    """
+    adapter = get_adapter()
+    if getattr(_local, 'adapter', None) is not adapter:
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+        _local.adapter = adapter
+    return _local.session
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=settings.UPSTREAM_FETCH_WORKERS)
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def get_breaker(upstream):
+    """This process's circuit breaker for upstream"""
+    global _breakers, _breakers_pid
+    with _breakers_lock:
+        if _breakers_pid != os.getpid():
+            _breakers = {}
+            _breakers_pid = os.getpid()
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _retry_wait(attempt):
+    #"full jitter" - spreads out the retries of callers that failed together
+    return random.uniform(0, min(settings.HTTP_RETRY_MAX_BACKOFF, settings.HTTP_RETRY_BACKOFF * 2 ** attempt))
+
+
+def submit(func, *args, **kwargs):
+    """Start an upstream call in this process's fetch pool and return its Future.
+
+    Use it for fetches that don't depend on each other, so a view waits for the
+    slowest one instead of all of them in turn.
+    """
+    view = metrics.current_view()
+    def call():
+        with metrics.view_context(view):
+            return func(*args, **kwargs)
+    return _get_executor().submit(call)
+
+
+def request(method, url, upstream='other', endpoint=None, retries=0, **kwargs):
+    """Send a request on this thread's session, timed as a call to upstream's endpoint
+    (which shouldn't include pids etc., to keep the number of metric series down).
+
+    Raises BackendDegraded instead of calling upstream while its circuit breaker is
+    open. retries is only for idempotent calls with a re-sendable body: connection
+    errors, timeouts and 502/503/504 responses are retried that many times, after a
+    jittered wait.
+    """
+    kwargs.setdefault('timeout', (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    endpoint = f'{method} {endpoint or ""}'.strip()
+    breaker = get_breaker(upstream)
+    for attempt in range(retries + 1):
+        try:
+            breaker.before_call()
+        except BackendDegraded:
+            metrics.observe(upstream, endpoint, metrics.current_view(), 'circuit_open', 0)
+            raise
+        start = time.monotonic()
+        try:
+            r = metrics.timed_call(upstream, endpoint, get_session().request, method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record(True, time.monotonic() - start)
+            if attempt == retries:
+                raise
+        except Exception:
+            #not upstream's fault - but a half-open probe still has to be finished
+            breaker.record(False, time.monotonic() - start)
+            raise
+        else:
+            breaker.record(r.status_code >= 500, time.monotonic() - start)
+            if attempt == retries or r.status_code not in RETRY_STATUSES:
+                return r
+        time.sleep(_retry_wait(attempt))
+
+
+def item_api_post(data):
+    return request('POST', settings.ITEM_POST_URL, upstream='item_api', data=data)
+
+
+def item_api_put(data, idempotent=False):
+    """idempotent PUTs (eg. setting an embargo date) are retried after transient errors"""
+    retries = settings.HTTP_RETRIES if idempotent else 0
+    return request('PUT', settings.ITEM_POST_URL, upstream='item_api', retries=retries, data=data)
+
+
+def item_api_put_multipart(encoder):
+    """PUT a MultipartEncoder body to the item API - streamed, with a Content-Length (not chunked)"""
+    return request('PUT', settings.ITEM_POST_URL, upstream='item_api', endpoint='multipart',
+            data=encoder, headers={'Content-Type': encoder.content_type})
+
+
+def reorder_api_post(data):
+    #sets absolute positions, so sending it twice does no harm
+    return request('POST', settings.REORDER_URL, upstream='reorder_api', retries=settings.HTTP_RETRIES, data=data)
+
+
+def thumbnail_get(pid, headers=None):
+    return request('GET', f'{settings.THUMBNAIL_BASE_URL}/{pid}/', upstream='thumbnail', endpoint='{pid}', headers=headers)
+
+
+def storage_get(pid, dsid):
+    return request('GET', f'{settings.STORAGE_BASE_URL}{pid}/{dsid}/', upstream='storage', endpoint=f'{{pid}}/{dsid}')
+
+
+def folder_api_get(collection_id):
+    return request('GET', f'{settings.FOLDER_API_PUBLIC}{collection_id}/', upstream='folder_api', endpoint='{collection_id}', verify=False)
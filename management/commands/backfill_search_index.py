@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from lxml import etree
+
+from ... import clients
+from ... import search_index
+from ...bulk import run_bulk
+from ...object_data import get_collection_ids, parse_object_label
+
+
+FIND_OBJECTS_PAGE_SIZE = 500
+
+
+def find_objects(query):
+    """Yield pages of (pid, label) from Fedora's findObjects, following the session token"""
+    repo = clients.get_repo()
+    params = {'query': query, 'resultFormat': 'xml', 'pid': 'true', 'label': 'true', 'maxResults': FIND_OBJECTS_PAGE_SIZE}
+    while True:
+        root = etree.fromstring(repo.api.get('objects', params=params).content)
+        yield [(fields.findtext('{*}pid'), fields.findtext('{*}label') or '') for fields in root.iter('{*}objectFields')]
+        token = root.findtext('{*}listSession/{*}token')
+        if not token:
+            break
+        params = {'query': query, 'resultFormat': 'xml', 'sessionToken': token}
+
+
+def index_pid(pid, label, with_collections):
+    if label is None:
+        label = parse_object_label(clients.get_repo().api.getObjectProfile(pid).content)
+    collection_ids = get_collection_ids(pid) if with_collections else None
+    search_index.index_object(pid, title=label, collection_ids=collection_ids)
+
+
+class Command(BaseCommand):
+    help = 'Add objects to the pid/title search index used by the landing page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pids', nargs='*', help='pids to index (default: every object --query finds)')
+        parser.add_argument('--query', default='pid~*', help='Fedora findObjects query, used when no pids are given')
+        parser.add_argument('--collections', action='store_true',
+                help='also index collection ids from irMetadata (a storage API call per object)')
+
+    def handle(self, *args, **options):
+        if options['pids']:
+            pages = [[(pid, None) for pid in options['pids']]]
+        else:
+            pages = find_objects(options['query'])
+        indexed = 0
+        for page in pages:
+            jobs = ((pid, (pid, label, options['collections'])) for pid, label in page)
+            for pid, error in run_bulk(index_pid, jobs):
+                if error:
+                    self.stderr.write(f'{pid}: {error}')
+                else:
+                    indexed += 1
+        self.stdout.write(f'indexed {indexed} objects')
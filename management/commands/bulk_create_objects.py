@@ -0,0 +1,37 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import bulk_create
+
+
+class Command(BaseCommand):
+    help = 'Create an object for each row of a CSV of title[,collection_id[,mods]], printing a CSV report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch', help='batch name to record the rows under (default: a hash of the CSV) - rerun with the same batch to resume')
+        parser.add_argument('--retry-interrupted', action='store_true',
+                help='also post rows that were cut off last time (they may already have been created)')
+        parser.add_argument('--submitter', default='manage.py', help='recorded as the submitter of new rows')
+        parser.add_argument('--workers', type=int, help='concurrent item API posts (default: REPO_DIRECT_BULK_MAX_WORKERS)')
+
+    def handle(self, *args, **options):
+        with open(options['csv_path'], 'rb') as f:
+            content = f.read()
+        try:
+            rows = bulk_create.parse_create_rows(content)
+        except ValueError as e:
+            raise CommandError(str(e))
+        batch = options['batch'] or bulk_create.batch_id_for(content)
+        self.stderr.write(f'batch {batch}: {len(rows)} rows')
+        writer = csv.writer(self.stdout)
+        writer.writerow(bulk_create.REPORT_COLUMNS)
+        counts = {}
+        results = bulk_create.run_batch(batch, rows, options['submitter'],
+                retry_interrupted=options['retry_interrupted'], max_workers=options['workers'])
+        for row, result in results:
+            writer.writerow(bulk_create.report_row(row, result))
+            self.stdout.flush()
+            counts[result] = counts.get(result, 0) + 1
+        self.stderr.write(', '.join(f'{count} {result}' for result, count in sorted(counts.items())))
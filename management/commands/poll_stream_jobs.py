@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...stream_jobs import poll_stream_jobs
+
+
+class Command(BaseCommand):
+    help = 'Update the status of in-flight streaming derivative jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', help='only poll jobs for this pid')
+
+    def handle(self, *args, **options):
+        poll_stream_jobs(options['pid'])
@@ -0,0 +1,156 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_calls = {} #(upstream, endpoint, view, status) -> count
+_latencies = {} #(upstream, endpoint, view) -> [count per bucket..., +Inf count, sum]
+_in_flight = {} #upstream -> count
+_current = threading.local()
+
+
+def current_view():
+    return getattr(_current, 'view', '')
+
+
+@contextmanager
+def view_context(view_name):
+    """Label upstream calls made by this thread with view_name"""
+    previous = current_view()
+    _current.view = view_name
+    try:
+        yield
+    finally:
+        _current.view = previous
+
+
+def track_view(view_func):
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with view_context(view_func.__name__):
+            return view_func(*args, **kwargs)
+    return wrapper
+
+
+def _adjust_in_flight(upstream, change):
+    with _lock:
+        _in_flight[upstream] = _in_flight.get(upstream, 0) + change
+
+
+def observe(upstream, endpoint, view, status, seconds):
+    with _lock:
+        key = (upstream, endpoint, view, str(status))
+        _calls[key] = _calls.get(key, 0) + 1
+        buckets = _latencies.setdefault((upstream, endpoint, view), [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                buckets[index] += 1
+        buckets[len(LATENCY_BUCKETS)] += 1
+        buckets[-1] += seconds
+
+
+def timed_call(upstream, endpoint, func, *args, **kwargs):
+    """Call func, recording it as a call to upstream's endpoint from the current view.
+
+    The status label is the result's status_code if it has one ('ok' otherwise), or
+    'error' if func raised.
+    """
+    view = current_view()
+    status = 'error'
+    _adjust_in_flight(upstream, 1)
+    start = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+        status = getattr(result, 'status_code', 'ok')
+        return result
+    finally:
+        observe(upstream, endpoint, view, status, time.monotonic() - start)
+        _adjust_in_flight(upstream, -1)
+
+
+def fedora_endpoint(path):
+    """Fedora REST path with the pid & dsid taken out, eg. objects/{pid}/datastreams/{dsid}/content"""
+    segments = path.strip('/').split('/')
+    if 'objects' not in segments:
+        return path
+    segments = segments[segments.index('objects'):]
+    for index in range(1, len(segments)):
+        if segments[index - 1] == 'objects':
+            segments[index] = '{pid}'
+        elif segments[index - 1] == 'datastreams':
+            segments[index] = '{dsid}'
+    return '/'.join(segments)
+
+
+def time_adapter(adapter, upstream, endpoint_for=None):
+    """Record every request a transport adapter sends as a call to upstream.
+
+    Wraps the adapter's own send, so it keeps its retries & connection pool settings.
+    """
+    def timed_send(request, **kwargs):
+        path = request.path_url.split('?')[0]
+        endpoint = f'{request.method} {endpoint_for(path) if endpoint_for else path}'
+        #looked up on the class each time, so the adapter behaves like any other (eg. when it's mocked)
+        return timed_call(upstream, endpoint, type(adapter).send, adapter, request, **kwargs)
+    adapter.send = timed_send
+    return adapter
+
+
+def instrument_fedora(repo):
+    """Time every request eulfedora's Repository sends to Fedora"""
+    time_adapter(repo.api.session.get_adapter(repo.api.base_url), 'fedora', endpoint_for=fedora_endpoint)
+
+
+def reset():
+    with _lock:
+        _calls.clear()
+        _latencies.clear()
+        _in_flight.clear()
+
+
+def _labels(**labels):
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{%s}' % ','.join(escaped)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format.
+
+    Metrics are per process - with several workers, each scrape sees the worker
+    that answered it.
+    """
+    with _lock:
+        calls = dict(_calls)
+        latencies = {key: list(value) for key, value in _latencies.items()}
+        in_flight = dict(_in_flight)
+    lines = [
+        '# HELP repo_direct_upstream_requests_total Upstream calls by upstream, endpoint, view & status.',
+        '# TYPE repo_direct_upstream_requests_total counter',
+    ]
+    for (upstream, endpoint, view, status), count in sorted(calls.items()):
+        lines.append(f'repo_direct_upstream_requests_total{_labels(upstream=upstream, endpoint=endpoint, view=view, status=status)} {count}')
+    lines += [
+        '# HELP repo_direct_upstream_request_duration_seconds Upstream call latency.',
+        '# TYPE repo_direct_upstream_request_duration_seconds histogram',
+    ]
+    for (upstream, endpoint, view), buckets in sorted(latencies.items()):
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            labels = _labels(upstream=upstream, endpoint=endpoint, view=view, le=bound)
+            lines.append(f'repo_direct_upstream_request_duration_seconds_bucket{labels} {count}')
+        labels = _labels(upstream=upstream, endpoint=endpoint, view=view)
+        lines.append(f'repo_direct_upstream_request_duration_seconds_sum{labels} {buckets[-1]}')
+        lines.append(f'repo_direct_upstream_request_duration_seconds_count{labels} {buckets[len(LATENCY_BUCKETS)]}')
+    lines += [
+        '# HELP repo_direct_upstream_in_flight Upstream calls currently waiting for a response.',
+        '# TYPE repo_direct_upstream_in_flight gauge',
+    ]
+    for upstream, count in sorted(in_flight.items()):
+        lines.append(f'repo_direct_upstream_in_flight{_labels(upstream=upstream)} {count}')
+    return '\n'.join(lines) + '\n'
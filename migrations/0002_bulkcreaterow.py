@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_direct_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkCreateRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.CharField(db_index=True, max_length=64)),
+                ('row_number', models.PositiveIntegerField()),
+                ('title', models.TextField(blank=True)),
+                ('collection_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('mods', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('posting', 'Posting (outcome unknown if the batch was interrupted)'), ('created', 'Created'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('pid', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('submitter', models.CharField(max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['batch', 'row_number'],
+                'unique_together': {('batch', 'row_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_direct_app', '0002_bulkcreaterow'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='streamjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=['queued', 'running']), fields=('pid',), name='one_in_flight_stream_job_per_pid'),
+        ),
+    ]
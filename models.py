@@ -1,14 +1,34 @@
 from django.db import models
-from . import app_settings as settings
+from django.utils import timezone
 import requests
+from . import app_settings as settings
+from . import http_client
+from .caching import TTLCache
+
+
+class FolderApiError(Exception):
+    pass
+
+
+collection_info_cache = TTLCache(
+        max_size=settings.COLLECTION_CACHE_MAX_SIZE,
+        ttl=settings.COLLECTION_CACHE_TTL,
+        max_stale=settings.COLLECTION_CACHE_MAX_STALE,
+    )
+
 
 class BDR_Collection(object):
-    """docstring for BDR_Collection"""
+    """Folder information from the folder API, shared across requests through
+    a process-wide cache keyed by collection id."""
     def __init__(self, collection_id):
         super(BDR_Collection, self).__init__()
         self.id = collection_id
         self.collection_info = {}
 
+    @staticmethod
+    def invalidate(collection_id):
+        collection_info_cache.invalidate(str(collection_id))
+
     @property
     def info(self):
         if not self.collection_info:
@@ -16,12 +36,17 @@ class BDR_Collection(object):
         return self.collection_info
 
     def _request_info(self):
+        try:
+            return collection_info_cache.get(str(self.id), self._fetch_info)
+        except FolderApiError:
+            return {}
+
+    def _fetch_info(self):
+        r = http_client.folder_api_get(self.id)
+        if r.status_code != requests.codes.ok:
+            raise FolderApiError(f'{r.status_code} - {r.text}')
         info = {}
-        url = '%s%s/' % (settings.FOLDER_API_PUBLIC, self.id)
-        r = requests.get(url, verify=False)
-        if r.status_code == requests.codes.ok:
-            collection_info = r.json()
-            info.update(collection_info)
+        info.update(r.json())
         return info
 
     @property
@@ -39,3 +64,89 @@ class BDR_Collection(object):
     @property
     def subfolder_choices(self):
         return [(str(subfolder['id']), subfolder['name']) for subfolder in self.subfolders]
+
+
+class StreamJob(models.Model):
+    """A streaming derivative job queued through the item API"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+        (EXPIRED, 'Expired (no status received)'),
+    )
+    IN_FLIGHT_STATUSES = (QUEUED, RUNNING)
+
+    pid = models.CharField(max_length=255, db_index=True)
+    visibility = models.CharField(max_length=255)
+    submitter = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    status_detail = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    last_checked = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+        constraints = [
+            #the in-flight check happens as a job is created, so two quick submits can't both get through -
+            #  a partial index, which Django only creates on databases that support them (not MySQL)
+            models.UniqueConstraint(fields=['pid'], condition=models.Q(status__in=['queued', 'running']), name='one_in_flight_stream_job_per_pid'),
+        ]
+
+    def __str__(self):
+        return f'{self.pid} stream job ({self.status})'
+
+    @classmethod
+    def in_flight(cls, pid=None):
+        jobs = cls.objects.filter(status__in=cls.IN_FLIGHT_STATUSES)
+        if pid:
+            jobs = jobs.filter(pid=pid)
+        return jobs
+
+    @property
+    def is_in_flight(self):
+        return self.status in self.IN_FLIGHT_STATUSES
+
+    def due_for_check(self):
+        if not self.last_checked:
+            return True
+        return (timezone.now() - self.last_checked).total_seconds() >= settings.STREAM_JOB_POLL_INTERVAL
+
+
+class BulkCreateRow(models.Model):
+    """One row of a bulk create CSV - kept so an interrupted batch can be resumed"""
+    PENDING = 'pending'
+    POSTING = 'posting'
+    CREATED = 'created'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (POSTING, 'Posting (outcome unknown if the batch was interrupted)'),
+        (CREATED, 'Created'),
+        (FAILED, 'Failed'),
+    )
+
+    batch = models.CharField(max_length=64, db_index=True)
+    row_number = models.PositiveIntegerField()
+    title = models.TextField(blank=True)
+    collection_id = models.PositiveIntegerField(null=True, blank=True)
+    mods = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    pid = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    submitter = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['batch', 'row_number']
+        unique_together = ('batch', 'row_number')
+
+    def __str__(self):
+        return f'{self.batch} row {self.row_number} ({self.status})'
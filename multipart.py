@@ -0,0 +1,86 @@
+import os
+import uuid
+
+from . import app_settings as settings
+
+
+CRLF = b'\r\n'
+
+
+def _quote(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class MultipartEncoder(object):
+    """multipart/form-data body that is generated as it's sent.
+
+    Form fields are small and encoded up front; each file is read in
+    chunk_size pieces, so memory use doesn't depend on the size of the files.
+    A file can also be bytes or any other buffer (eg. a memoryview) - it's sent
+    in chunk_size slices of the buffer, without copying the whole thing first.
+    Its len() is the length of the whole body, worked out without reading the
+    files - pass the encoder itself as the request data, and requests sends it
+    with a Content-Length rather than chunked transfer encoding.
+    """
+
+    def __init__(self, fields, files, chunk_size=None):
+        self.fields = fields
+        self.files = files
+        self.chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        self.boundary = uuid.uuid4().hex
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def _part_header(self, name, filename=None):
+        disposition = f'form-data; name="{_quote(name)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}'
+        if filename is not None:
+            header += f'; filename="{_quote(filename)}"\r\nContent-Type: application/octet-stream'
+        return (header + '\r\n\r\n').encode('utf8')
+
+    def _field_parts(self):
+        for name, value in self.fields.items():
+            if isinstance(value, str):
+                value = value.encode('utf8')
+            yield self._part_header(name) + value + CRLF
+
+    def _file_name(self, name, file_obj):
+        return os.path.basename(getattr(file_obj, 'name', None) or name)
+
+    @staticmethod
+    def _remaining_size(file_obj):
+        if not hasattr(file_obj, 'read'):
+            return memoryview(file_obj).nbytes
+        position = file_obj.tell()
+        size = getattr(file_obj, 'size', None) #uploaded files know their size
+        if size is None:
+            size = file_obj.seek(0, os.SEEK_END)
+            file_obj.seek(position)
+        return size - position
+
+    def __len__(self):
+        length = sum(len(part) for part in self._field_parts())
+        for name, file_obj in self.files:
+            length += len(self._part_header(name, self._file_name(name, file_obj)))
+            length += self._remaining_size(file_obj) + len(CRLF)
+        return length + len(f'--{self.boundary}--\r\n'.encode('utf8'))
+
+    def __iter__(self):
+        yield from self._field_parts()
+        for name, file_obj in self.files:
+            yield self._part_header(name, self._file_name(name, file_obj))
+            if hasattr(file_obj, 'read'):
+                while True:
+                    chunk = file_obj.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            else:
+                buffer = memoryview(file_obj).cast('B')
+                for start in range(0, len(buffer), self.chunk_size):
+                    #only this slice is copied - urllib3 wants bytes chunks
+                    yield bytes(buffer[start:start + self.chunk_size])
+            yield CRLF
+        yield f'--{self.boundary}--\r\n'.encode('utf8')
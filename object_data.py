@@ -0,0 +1,289 @@
+import uuid
+from collections import OrderedDict, namedtuple
+from django.core.cache import cache
+from lxml import etree
+
+from . import app_settings as settings
+from . import http_client
+
+
+DatastreamProfile = namedtuple('DatastreamProfile', [
+    'dsid',
+    'label',
+    'state',
+    'mimetype',
+    'size',
+    'created',
+    'control_group',
+    'version_id',
+    'checksum_type',
+    'checksum',
+])
+
+PROFILE_FIELDS = {
+    'dsLabel': 'label',
+    'dsState': 'state',
+    'dsMIME': 'mimetype',
+    'dsSize': 'size',
+    'dsCreateDate': 'created',
+    'dsControlGroup': 'control_group',
+    'dsVersionID': 'version_id',
+    'dsChecksumType': 'checksum_type',
+    'dsChecksum': 'checksum',
+}
+
+
+def _local_name(element):
+    return etree.QName(element).localname
+
+
+def _profile_from_element(dsid, profile_element):
+    values = dict.fromkeys(DatastreamProfile._fields)
+    values['dsid'] = dsid
+    for child in profile_element:
+        if not isinstance(child.tag, str):
+            continue
+        field = PROFILE_FIELDS.get(_local_name(child))
+        if field:
+            values[field] = (child.text or '').strip()
+    if values['size']:
+        try:
+            values['size'] = int(values['size'])
+        except ValueError:
+            values['size'] = None
+    else:
+        values['size'] = None
+    return DatastreamProfile(**values)
+
+
+def parse_datastream_profile(xml, dsid):
+    """Parse a single datastreamProfile document (getDatastream response)"""
+    return _profile_from_element(dsid, etree.fromstring(xml))
+
+
+def parse_datastream_profiles(xml):
+    """Parse a listDatastreams response in one pass.
+
+    Returns (profiles, dsids_without_profile): the profiles found, keyed by dsid in
+    Fedora's order, and the ids of any datastreams that were only listed (older
+    Fedoras ignore the profiles parameter and return bare <datastream> entries).
+    """
+    root = etree.fromstring(xml)
+    profiles = OrderedDict()
+    dsids_without_profile = []
+    for element in root:
+        if not isinstance(element.tag, str):
+            continue
+        name = _local_name(element)
+        if name == 'datastreamProfile':
+            dsid = element.get('dsID') or element.get('dsid')
+            profiles[dsid] = _profile_from_element(dsid, element)
+        elif name == 'datastream':
+            dsid = element.get('dsid')
+            profiles[dsid] = None
+            dsids_without_profile.append(dsid)
+    return profiles, dsids_without_profile
+
+
+def _generation_key(pid):
+    return f'repo_direct:object:{pid}:generation'
+
+
+def _current_generation(pid):
+    """The token cached values of pid have to carry to be fresh.
+
+    It's a new random token whenever it's missing, not a counter starting from 0,
+    so if the cache evicts it the entries stored before are all stale, not fresh
+    again.
+    """
+    key = _generation_key(pid)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def cached_object_data(pid, name, loader):
+    """Return loader()'s result for pid from the cache, loading it on a miss.
+
+    Values are stored with the generation that was current before loading, so a
+    load that races with a write carries the old generation and is never used.
+    """
+    generation = _current_generation(pid)
+    key = f'repo_direct:object:{pid}:{name}'
+    cached = cache.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    value = loader()
+    cache.set(key, (generation, value), settings.OBJECT_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate_object(pid):
+    """Forget everything cached for pid - call this as soon as a write to it succeeds"""
+    cache.set(_generation_key(pid), uuid.uuid4().hex, None)
+
+
+def get_object_profile(repo, pid):
+    """Object profile XML - raises RequestFailed if the object doesn't exist"""
+    return cached_object_data(pid, 'profile', lambda: repo.api.getObjectProfile(pid).content)
+
+
+def get_rels_ext(repo, pid):
+    """RELS-EXT content, or b'' if the object doesn't have one"""
+    from eulfedora.util import RequestFailed
+    def load():
+        try:
+            return repo.api.getDatastreamDissemination(pid, 'RELS-EXT').content
+        except RequestFailed as e:
+            if e.code != 404:
+                raise
+            return b''
+    return cached_object_data(pid, 'rels_ext', load)
+
+
+def get_ir_metadata(pid):
+    """irMetadata content from the storage API"""
+    def load():
+        r = http_client.storage_get(pid, 'irMetadata')
+        if not r.ok:
+            raise Exception(f'{r.status_code} - {r.text}')
+        return r.content
+    return cached_object_data(pid, 'irMetadata', load)
+
+
+def get_collection_ids(pid):
+    """The collection ids in an object's irMetadata"""
+    from eulxml.xmlmap import load_xmlobject_from_string
+    from bdrxml import irMetadata
+    ir_obj = load_xmlobject_from_string(get_ir_metadata(pid), irMetadata.IR)
+    return list(ir_obj.collection_list)
+
+
+def parse_object_label(xml):
+    """The objLabel (title) from object profile XML"""
+    root = etree.fromstring(xml)
+    for element in root:
+        if isinstance(element.tag, str) and _local_name(element) == 'objLabel':
+            return (element.text or '').strip()
+    return ''
+
+
+CHILD_OF_PREDICATE = 'info:fedora/fedora-system:def/relations-external#isPartOf'
+
+
+def parse_child_orders(rows):
+    """{child pid: int order} from risearch (child, order) rows - None if a child
+    doesn't have exactly one whole-number order"""
+    orders = {}
+    for row in rows:
+        child_pid = (row.get('child') or '').replace('info:fedora/', '', 1)
+        if not child_pid:
+            continue
+        try:
+            order = int(row.get('order') or '')
+        except ValueError:
+            return None
+        if child_pid in orders:
+            return None
+        orders[child_pid] = order
+    return orders
+
+
+def get_child_orders(repo, pid, order_predicate):
+    """Current order of each of pid's children, read from the RELS-EXT statements in
+    Fedora's resource index.
+
+    Not cached, and the index is flushed first, so the orders include every write
+    Fedora has accepted - the BDR API's copy is updated in the background and may
+    be behind.
+    """
+    query = (
+        'SELECT ?child ?order FROM <#ri> WHERE { '
+        f'?child <{CHILD_OF_PREDICATE}> <info:fedora/{pid}> . '
+        f'?child <{order_predicate}> ?order . }}'
+    )
+    return parse_child_orders(repo.risearch.find_statements(query, language='sparql', type='tuples', flush=True))
+
+
+def load_datastream_profile(repo, pid, dsid, as_of=None):
+    """Profile of a datastream straight from Fedora (not cached)"""
+    r = repo.api.getDatastream(pid, dsid, asOfDateTime=as_of)
+    return parse_datastream_profile(r.content, dsid)
+
+
+def get_datastream_profile(repo, pid, dsid, as_of=None):
+    """Profile of a datastream - or of the version current at as_of (an aware datetime).
+
+    Cached, so a datastream changed outside repo_direct can be out of date here -
+    use load_datastream_profile where that matters (eg. validators for the content).
+    """
+    def load():
+        return load_datastream_profile(repo, pid, dsid, as_of=as_of)
+    name = f'datastream_profile:{dsid}'
+    if as_of:
+        name += f':{as_of.isoformat()}'
+    return cached_object_data(pid, name, load)
+
+
+def parse_datastream_history(xml, dsid):
+    """Parse a getDatastreamHistory response - a profile per version, newest first"""
+    root = etree.fromstring(xml)
+    return [_profile_from_element(dsid, element) for element in root
+            if isinstance(element.tag, str) and _local_name(element) == 'datastreamProfile']
+
+
+def get_datastream_history(repo, pid, dsid):
+    """Every version's profile, from one Fedora call - cached until the object is next written"""
+    def load():
+        r = repo.api.getDatastreamHistory(pid, dsid, format='xml')
+        return parse_datastream_history(r.content, dsid)
+    return cached_object_data(pid, f'history:{dsid}', load)
+
+
+def _load_datastream_profiles(repo, pid):
+    r = repo.api.get(f'objects/{pid}/datastreams', params={'format': 'xml', 'profiles': 'true'})
+    profiles, dsids_without_profile = parse_datastream_profiles(r.content)
+    #fall back to one call per datastream if Fedora didn't send the profiles
+    for dsid in dsids_without_profile:
+        ds_r = repo.api.getDatastream(pid, dsid)
+        profiles[dsid] = parse_datastream_profile(ds_r.content, dsid)
+    return profiles
+
+
+def get_datastream_profiles(repo, pid):
+    """Load state, mimetype, size and checksum of every datastream of an object.
+
+    Uses the profiles option of listDatastreams, so it's a single Fedora call
+    regardless of the number of datastreams.
+    """
+    return cached_object_data(pid, 'datastream_profiles', lambda: _load_datastream_profiles(repo, pid))
+
+
+def has_usable_checksum(profile):
+    """True if Fedora has a checksum for the datastream (not disabled or 'none')"""
+    return bool(profile.checksum) and profile.checksum_type not in ('DISABLED', None) and profile.checksum != 'none'
+
+
+def datastream_version_key(profile):
+    """A string that changes whenever the datastream content does"""
+    if has_usable_checksum(profile):
+        return profile.checksum
+    return f'{profile.version_id}_{profile.created}'
+
+
+def get_pretty_xml(repo, pid, profile):
+    """Pretty-printed XML content of a datastream, cached by content version so
+    reopening an unchanged datastream skips the download and parse.
+
+    Raises lxml's XMLSyntaxError if the content isn't well-formed.
+    """
+    key = f'repo_direct:pretty_xml:{pid}:{profile.dsid}:{datastream_version_key(profile)}'
+    xml_content = cache.get(key)
+    if xml_content is None:
+        r = repo.api.getDatastreamDissemination(pid, profile.dsid)
+        root = etree.fromstring(r.content, etree.XMLParser(remove_blank_text=True))
+        xml_content = etree.tostring(root, encoding='UTF-8', pretty_print=True).decode('utf8')
+        cache.set(key, xml_content, settings.XML_PRETTY_CACHE_TIMEOUT)
+    return xml_content
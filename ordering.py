@@ -0,0 +1,68 @@
+from bisect import bisect_left
+
+
+def longest_increasing_subsequence(values):
+    """Indexes of one longest strictly increasing subsequence of values (O(n log n))"""
+    tail_indexes = []
+    tail_values = []
+    predecessors = [None] * len(values)
+    for index, value in enumerate(values):
+        position = bisect_left(tail_values, value)
+        if position > 0:
+            predecessors[index] = tail_indexes[position - 1]
+        if position == len(tail_indexes):
+            tail_indexes.append(index)
+            tail_values.append(value)
+        else:
+            tail_indexes[position] = index
+            tail_values[position] = value
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(index)
+        index = predecessors[index]
+    return result[::-1]
+
+
+def _fill_gap(moved_pids, low, high, pairs):
+    """Give moved_pids consecutive orders after low, if they fit below high"""
+    if high is not None and high - low - 1 < len(moved_pids):
+        return False
+    pairs.extend((pid, str(low + offset)) for offset, pid in enumerate(moved_pids, 1))
+    return True
+
+
+def _gap_pairs(current_orders, new_pids):
+    orders = [current_orders[pid] for pid in new_pids]
+    kept = set(longest_increasing_subsequence(orders))
+    pairs = []
+    moved = []
+    previous_order = 0
+    for index, pid in enumerate(new_pids):
+        if index in kept:
+            if not _fill_gap(moved, previous_order, orders[index], pairs):
+                return None
+            moved = []
+            previous_order = orders[index]
+        else:
+            moved.append(pid)
+    if not _fill_gap(moved, previous_order, None, pairs):
+        return None
+    return pairs
+
+
+def changed_order_pairs(current_orders, new_pids):
+    """(pid, order) pairs that turn current_orders ({pid: int order}) into new_pids' order.
+
+    Children on a longest increasing run of the current orders stay put; only the
+    others are moved, into the gaps between their unmoved neighbours if there is
+    room. Otherwise the children are renumbered 1..n and only the ones whose
+    number changed are returned. Returns None if the pids don't match the current
+    children (so the caller has to send the full order).
+    """
+    if len(new_pids) != len(current_orders) or set(new_pids) != set(current_orders):
+        return None
+    pairs = _gap_pairs(current_orders, new_pids)
+    if pairs is None:
+        pairs = [(pid, str(order)) for order, pid in enumerate(new_pids, 1) if current_orders[pid] != order]
+    return pairs
@@ -0,0 +1,92 @@
+"""Local SQLite index of pids, titles & collection ids for the landing page's type-ahead.
+
+It's filled in as objects are viewed or edited here (and by the
+backfill_search_index command), so lookups never go to Fedora or Solr. Indexing
+is best-effort: errors are logged, never raised into a view.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from . import app_settings as settings
+
+
+logger = logging.getLogger('ingest')
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS objects (
+        id INTEGER PRIMARY KEY,
+        pid TEXT NOT NULL UNIQUE,
+        title TEXT NOT NULL DEFAULT '',
+        collections TEXT NOT NULL DEFAULT ''
+    )''',
+    #external content table - the text lives in objects, the triggers keep the index in step
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS objects_fts USING fts5(
+        pid, title, collections, content='objects', content_rowid='id', tokenize="unicode61 tokenchars ':'"
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS objects_ai AFTER INSERT ON objects BEGIN
+        INSERT INTO objects_fts(rowid, pid, title, collections) VALUES (new.id, new.pid, new.title, new.collections);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS objects_ad AFTER DELETE ON objects BEGIN
+        INSERT INTO objects_fts(objects_fts, rowid, pid, title, collections) VALUES ('delete', old.id, old.pid, old.title, old.collections);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS objects_au AFTER UPDATE ON objects BEGIN
+        INSERT INTO objects_fts(objects_fts, rowid, pid, title, collections) VALUES ('delete', old.id, old.pid, old.title, old.collections);
+        INSERT INTO objects_fts(rowid, pid, title, collections) VALUES (new.id, new.pid, new.title, new.collections);
+    END''',
+]
+
+UPSERT = '''INSERT INTO objects (pid, title, collections) VALUES (:pid, COALESCE(:title, ''), COALESCE(:collections, ''))
+    ON CONFLICT(pid) DO UPDATE SET title = COALESCE(:title, title), collections = COALESCE(:collections, collections)
+    WHERE COALESCE(:title, title) != title OR COALESCE(:collections, collections) != collections'''
+
+_local = threading.local()
+
+
+def _connection():
+    """This thread's connection to the index, creating the tables the first time"""
+    path = settings.SEARCH_INDEX_PATH
+    if getattr(_local, 'pid', None) != os.getpid() or getattr(_local, 'path', None) != path:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        _local.connection = connection
+        _local.pid = os.getpid()
+        _local.path = path
+    return _local.connection
+
+
+def index_object(pid, title=None, collection_ids=None):
+    """Add or update pid's entry - a None title or collection_ids keeps what's there"""
+    collections = None
+    if collection_ids is not None:
+        collections = ' '.join(str(collection_id).strip() for collection_id in collection_ids if str(collection_id).strip())
+    try:
+        _connection().execute(UPSERT, {'pid': pid, 'title': title, 'collections': collections})
+    except sqlite3.Error:
+        logger.exception(f'error indexing {pid}')
+
+
+def _match_expression(text):
+    #every word has to match, each as a prefix (so "test:12" finds test:123)
+    terms = re.findall(r'[\w:]+', text)
+    return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+
+def search(text, limit=None):
+    """[{'pid': ..., 'title': ...}] of the best matches for some typed text"""
+    expression = _match_expression(text)
+    if not expression:
+        return []
+    try:
+        rows = _connection().execute(
+                'SELECT pid, title FROM objects_fts WHERE objects_fts MATCH ? ORDER BY rank LIMIT ?',
+                (expression, limit or settings.SEARCH_RESULTS_LIMIT)
+            ).fetchall()
+    except sqlite3.Error:
+        logger.exception(f'error searching index for {text!r}')
+        return []
+    return [{'pid': pid, 'title': title} for pid, title in rows]
@@ -0,0 +1,98 @@
+import logging
+import threading
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import app_settings as settings
+from . import http_client
+from .models import StreamJob
+
+
+logger = logging.getLogger('ingest')
+
+STATUSES = dict(StreamJob.STATUS_CHOICES)
+
+
+def job_max_age():
+    """Seconds a job counts as in flight - STREAM_JOB_EXPIRY with a status service,
+    STREAM_JOB_DEDUPE_SECONDS without one"""
+    return settings.STREAM_JOB_EXPIRY if settings.STREAM_JOB_STATUS_URL else settings.STREAM_JOB_DEDUPE_SECONDS
+
+
+def poll_stream_job(job):
+    """Update one job from the status service, expiring it if it has been in flight
+    for longer than job_max_age()."""
+    if settings.STREAM_JOB_STATUS_URL:
+        try:
+            r = http_client.request('GET', settings.STREAM_JOB_STATUS_URL.format(pid=job.pid), upstream='stream_job_status')
+            if r.ok:
+                data = r.json()
+                if data.get('status') in STATUSES:
+                    job.status = data['status']
+                    job.status_detail = data.get('detail', '')
+            else:
+                logger.error(f'error checking stream job for {job.pid}: {r.status_code} - {r.text}')
+        except Exception:
+            logger.exception(f'error checking stream job for {job.pid}')
+    now = timezone.now()
+    if job.is_in_flight and (now - job.created).total_seconds() > job_max_age():
+        job.status = StreamJob.EXPIRED
+    job.last_checked = now
+    job.save()
+    return job
+
+
+def poll_stream_jobs(pid=None):
+    """Poll every in-flight job (for one pid, if given) that is due for a check"""
+    for job in StreamJob.in_flight(pid):
+        if job.due_for_check():
+            poll_stream_job(job)
+
+
+def create_stream_job(pid, visibility, submitter, supersede=False):
+    """Record a new job for pid - or return None if one is already in flight, unless
+    supersede is given (the earlier jobs are then expired).
+
+    The pid's in-flight jobs are locked while this runs, so a concurrent submission
+    waits for it. Two submissions when there's no job yet are kept apart by the
+    one_in_flight_stream_job_per_pid constraint (an IntegrityError) - that's a
+    partial unique index, so it needs PostgreSQL or SQLite; Django leaves it out
+    on MySQL.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        earlier_jobs = list(StreamJob.in_flight(pid).select_for_update())
+        for job in earlier_jobs:
+            if (now - job.created).total_seconds() > job_max_age():
+                job.status = StreamJob.EXPIRED
+            elif supersede:
+                job.status = StreamJob.EXPIRED
+                job.status_detail = f'superseded by a later submission from {submitter}'
+            else:
+                return None
+            job.last_checked = now
+            job.save()
+        return StreamJob.objects.create(pid=pid, visibility=visibility, submitter=submitter)
+
+
+def _poll_in_thread(pid):
+    close_old_connections()
+    try:
+        poll_stream_jobs(pid)
+    except Exception:
+        logger.exception(f'error polling stream jobs for {pid}')
+    finally:
+        connection.close()
+
+
+def refresh_stream_jobs(pid):
+    """Bring a pid's in-flight jobs up to date without holding up the request.
+
+    Checking the status service happens in a background thread; without one
+    configured, only the (local) expiry check is left, so that runs inline.
+    """
+    if settings.STREAM_JOB_STATUS_URL:
+        thread = threading.Thread(target=_poll_in_thread, args=(pid,), daemon=True)
+        thread.start()
+    else:
+        poll_stream_jobs(pid)
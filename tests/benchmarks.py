@@ -0,0 +1,333 @@
+"""Benchmarks for the repo_direct views, run against a local stand-in for Fedora & the BDR APIs.
+
+Not part of the normal test run - run them with:
+
+    python manage.py test repo_direct_app.tests.benchmarks
+
+Each view is timed for every scenario. The report shows p50/p99 latency, the
+upstream calls per request and the peak memory traced during one request.
+Caches are cleared before every request, so the numbers are for cold requests.
+Environment variables:
+
+    REPO_DIRECT_BENCHMARK_ITERATIONS   requests per scenario (default 20)
+    REPO_DIRECT_BENCHMARK_LATENCY      seconds the stand-in waits before each response (default 0.005)
+    REPO_DIRECT_BENCHMARK_BASELINE     baseline JSON file (default tests/benchmark_baseline.json)
+    REPO_DIRECT_BENCHMARK_SAVE         set to 1 to save this run as the baseline
+    REPO_DIRECT_BENCHMARK_TOLERANCE    allowed p50 slowdown against the baseline (default 0.25)
+
+A scenario fails if it makes more upstream calls than the baseline, or if its p50
+is slower than the baseline by more than the tolerance.
+"""
+import json
+import os
+import pathlib
+import re
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import urlparse
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from eulfedora.server import Repository
+from .. import app_settings as settings
+from workshop_common import test_data
+
+
+CUR_DIR = pathlib.Path(__file__).parent
+ITERATIONS = int(os.environ.get('REPO_DIRECT_BENCHMARK_ITERATIONS', 20))
+LATENCY = float(os.environ.get('REPO_DIRECT_BENCHMARK_LATENCY', 0.005))
+BASELINE_PATH = pathlib.Path(os.environ.get('REPO_DIRECT_BENCHMARK_BASELINE', CUR_DIR / 'benchmark_baseline.json'))
+SAVE_BASELINE = os.environ.get('REPO_DIRECT_BENCHMARK_SAVE') == '1'
+TOLERANCE = float(os.environ.get('REPO_DIRECT_BENCHMARK_TOLERANCE', 0.25))
+
+PID = 'test:123'
+BASE_DATASTREAMS = ['DC', 'RELS-EXT', 'rightsMetadata', 'MODS', 'irMetadata']
+DATASTREAM_COUNTS = [5, 50, 500]
+CHILD_COUNTS = [10, 1000, 10000]
+XML_SIZES = [1024, 1024 * 1024, 50 * 1024 * 1024]
+
+DS_PROFILE = '''<datastreamProfile xmlns="http://www.fedora.info/definitions/1/0/management/" pid="{pid}" dsID="{dsid}">
+<dsLabel>{dsid}</dsLabel><dsVersionID>{dsid}.0</dsVersionID><dsCreateDate>2016-01-01T00:00:00.000Z</dsCreateDate>
+<dsState>A</dsState><dsMIME>text/xml</dsMIME><dsControlGroup>M</dsControlGroup><dsSize>{size}</dsSize>
+<dsChecksumType>MD5</dsChecksumType><dsChecksum>{dsid}-{size}</dsChecksum></datastreamProfile>'''
+
+
+def _xml_payload(size):
+    note = '  <mods:note>%s</mods:note>\n' % ('x' * 100)
+    head = '<?xml version="1.0" encoding="UTF-8"?>\n<mods:mods xmlns:mods="http://www.loc.gov/mods/v3">\n'
+    tail = '</mods:mods>\n'
+    count = max(1, (size - len(head) - len(tail)) // len(note))
+    return (head + note * count + tail).encode('utf8')
+
+
+class StandIn:
+    """What the stand-in server serves, and how many requests it has had"""
+
+    def __init__(self):
+        self.latency = LATENCY
+        self.datastream_count = 5
+        self.child_count = 10
+        self.xml_size = 1024
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._payloads = {}
+
+    def count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def xml(self):
+        if self.xml_size not in self._payloads:
+            self._payloads[self.xml_size] = _xml_payload(self.xml_size)
+        return self._payloads[self.xml_size]
+
+    def dsids(self):
+        return BASE_DATASTREAMS + [f'EXTRA{i}' for i in range(self.datastream_count - len(BASE_DATASTREAMS))]
+
+    def ds_size(self, dsid):
+        return len(self.xml()) if dsid == 'MODS' else 1024
+
+    def datastream_profile(self, dsid):
+        return DS_PROFILE.format(pid=PID, dsid=dsid, size=self.ds_size(dsid))
+
+    def datastreams(self):
+        profiles = ''.join(self.datastream_profile(dsid) for dsid in self.dsids())
+        return f'<objectDatastreams xmlns="http://www.fedora.info/definitions/1/0/access/" pid="{PID}">{profiles}</objectDatastreams>'
+
+    def item(self, pid):
+        children = [{'pid': f'test:child{i}', 'order': str(i)} for i in range(1, self.child_count + 1)]
+        return json.dumps({'pid': pid, 'brief': {'title': 'Test item'}, 'relations': {'hasPart': children}})
+
+
+FEDORA_DATASTREAM_RE = re.compile(r'^/fedora/objects/[^/]+/datastreams/(?P<dsid>[^/]+)(?P<content>/content)?$')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    break
+        else:
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, body, content_type='text/xml', status=200):
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route_get(self, path):
+        stand_in = self.server.stand_in
+        if path == f'/fedora/objects/{PID}':
+            return self._send(test_data.OBJECT_XML)
+        if path == f'/fedora/objects/{PID}/datastreams':
+            return self._send(stand_in.datastreams())
+        match = FEDORA_DATASTREAM_RE.match(path)
+        if match:
+            dsid = match.group('dsid')
+            if not match.group('content'):
+                return self._send(stand_in.datastream_profile(dsid))
+            if dsid == 'RELS-EXT':
+                return self._send(test_data.RELS_EXT_XML.format(cmodel='implicit-set'))
+            return self._send(stand_in.xml())
+        if path.startswith('/api/items/'):
+            return self._send(stand_in.item(path.split('/')[3]), content_type='application/json')
+        if path.endswith('/irMetadata/'):
+            return self._send(test_data.IR_METADATA_XML)
+        if path.startswith('/api/folders/'):
+            return self._send(json.dumps({'name': 'folder', 'children': []}), content_type='application/json')
+        return self._send('not found', status=404)
+
+    def do_GET(self):
+        self.server.stand_in.count_call()
+        time.sleep(self.server.stand_in.latency)
+        self._route_get(urlparse(self.path).path)
+
+    def do_PUT(self):
+        self.server.stand_in.count_call()
+        self._read_body()
+        time.sleep(self.server.stand_in.latency)
+        self._send('{}', content_type='application/json')
+
+    do_POST = do_PUT
+
+
+class StandInBDRResources:
+    """BDRResources' item API, pointed at the stand-in"""
+
+    def __init__(self, base):
+        self.item = self
+        self.base = base
+
+    def get(self, pid, identities=None):
+        r = requests.get(f'{self.base}/api/items/{pid}/')
+        r.raise_for_status()
+        item = type('BDRItem', (), {})()
+        item.data = r.json()
+        return item
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class ViewBenchmarks(TestCase):
+
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stand_in = StandIn()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.daemon_threads = True
+        cls.server.stand_in = cls.stand_in
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.patches = [
+            patch('repo_direct_app.clients.get_repo', return_value=Repository(root=f'{base}/fedora/', username='x', password='x')),
+            patch('repo_direct_app.clients.get_bdr_server', return_value=StandInBDRResources(base)),
+            patch.object(settings, 'ITEM_POST_URL', f'{base}/api/private/items/'),
+            patch.object(settings, 'REORDER_URL', f'{base}/api/private/reorder/'),
+            patch.object(settings, 'STORAGE_BASE_URL', f'{base}/storage/'),
+            patch.object(settings, 'THUMBNAIL_BASE_URL', f'{base}/viewers/image/thumbnail'),
+            patch.object(settings, 'FOLDER_API_PUBLIC', f'{base}/api/folders/'),
+        ]
+        for p in cls.patches:
+            p.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for p in cls.patches:
+            p.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls._report()
+        super().tearDownClass()
+
+    def setUp(self):
+        User.objects.create_user(username='x@brown.edu')
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+
+    def _run(self, name, make_request, expected_status):
+        latencies = []
+        calls = []
+        for i in range(ITERATIONS):
+            cache.clear()
+            calls_before = self.stand_in.calls
+            start = time.perf_counter()
+            r = make_request()
+            content = b''.join(r.streaming_content) if r.streaming else r.content
+            latencies.append(time.perf_counter() - start)
+            calls.append(self.stand_in.calls - calls_before)
+            self.assertEqual(r.status_code, expected_status, f'{name}: {content[:500]}')
+        #tracemalloc slows everything down, so memory gets its own run
+        cache.clear()
+        tracemalloc.start()
+        try:
+            r = make_request()
+            if r.streaming:
+                b''.join(r.streaming_content)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.results[name] = {
+            'p50': _percentile(latencies, 50),
+            'p99': _percentile(latencies, 99),
+            'upstream_calls': max(calls),
+            'peak_memory': peak_memory,
+        }
+
+    @classmethod
+    def _report(cls):
+        baseline = {}
+        if BASELINE_PATH.exists():
+            baseline = json.loads(BASELINE_PATH.read_text())
+        print(f'\n{"scenario":<45} {"p50 ms":>9} {"p99 ms":>9} {"calls":>6} {"peak MB":>9}  vs baseline')
+        regressions = []
+        for name, result in sorted(cls.results.items()):
+            line = f'{name:<45} {result["p50"] * 1000:>9.1f} {result["p99"] * 1000:>9.1f} {result["upstream_calls"]:>6} {result["peak_memory"] / 1024 / 1024:>9.2f}'
+            base = baseline.get(name)
+            if base:
+                line += f'  p50 {(result["p50"] / base["p50"] - 1) * 100:+.0f}%, calls {result["upstream_calls"] - base["upstream_calls"]:+d}'
+                if result['upstream_calls'] > base['upstream_calls']:
+                    regressions.append(f'{name}: {result["upstream_calls"]} upstream calls, baseline {base["upstream_calls"]}')
+                if result['p50'] > base['p50'] * (1 + TOLERANCE):
+                    regressions.append(f'{name}: p50 {result["p50"] * 1000:.1f}ms, baseline {base["p50"] * 1000:.1f}ms')
+            print(line)
+        if SAVE_BASELINE:
+            baseline.update(cls.results)
+            BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+            print(f'saved baseline to {BASELINE_PATH}')
+        elif not baseline:
+            print('no baseline to compare against - set REPO_DIRECT_BENCHMARK_SAVE=1 to save one')
+        if regressions:
+            raise AssertionError('benchmark regressions:\n' + '\n'.join(regressions))
+
+    def test_display(self):
+        url = reverse('repo_direct:display', kwargs={'pid': PID})
+        for count in DATASTREAM_COUNTS:
+            self.stand_in.datastream_count = count
+            self._run(f'display {count} datastreams', lambda: self.client.get(url, **self.auth), 200)
+
+    def test_reorder(self):
+        url = reverse('repo_direct:reorder', kwargs={'pid': PID})
+        for count in CHILD_COUNTS:
+            self.stand_in.child_count = count
+            self._run(f'reorder GET {count} children', lambda: self.client.get(url, **self.auth), 200)
+            new_order = ','.join([f'test:child{i}' for i in range(2, count + 1)] + ['test:child1'])
+            self._run(f'reorder POST {count} children',
+                    lambda: self.client.post(url, {'child_pids_ordered_list': new_order}, **self.auth), 302)
+
+    #the form posts the whole document, so big ones need a bigger request size limit
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None)
+    def test_xml_edit(self):
+        url = reverse('repo_direct:xml-edit', kwargs={'pid': PID, 'dsid': 'MODS'})
+        for size in XML_SIZES:
+            self.stand_in.xml_size = size
+            self._run(f'xml_edit GET {size // 1024} KB', lambda: self.client.get(url, **self.auth), 200)
+            xml_content = self.stand_in.xml().decode('utf8')
+            self._run(f'xml_edit POST {size // 1024} KB',
+                    lambda: self.client.post(url, {'xml_content': xml_content}, **self.auth), 302)
+
+    def test_add_content_file(self):
+        url = reverse('repo_direct:add_content_file', kwargs={'pid': PID})
+        for size in XML_SIZES:
+            content = _xml_payload(size)
+            def make_request():
+                upload = SimpleUploadedFile('content.xml', content, content_type='text/xml')
+                return self.client.post(url, {'content_file': upload}, **self.auth)
+            self._run(f'add_content_file {size // 1024} KB', make_request, 302)
+
+    def test_file_edit(self):
+        url = reverse('repo_direct:file-edit', kwargs={'pid': PID, 'dsid': 'EXTRA0'})
+        self.stand_in.datastream_count = 50
+        for size in XML_SIZES:
+            content = _xml_payload(size)
+            def make_request():
+                upload = SimpleUploadedFile('content.xml', content, content_type='text/xml')
+                return self.client.post(url, {'replacement_file': upload}, **self.auth)
+            self._run(f'file_edit {size // 1024} KB', make_request, 302)
+
+    def test_edit_item_collection(self):
+        url = reverse('repo_direct:edit_item_collection', kwargs={'pid': PID})
+        self._run('edit_item_collection GET', lambda: self.client.get(url, **self.auth), 200)
+        self._run('edit_item_collection POST', lambda: self.client.post(url, {'collection_ids': '1,2'}, **self.auth), 302)
@@ -1,18 +1,330 @@
+import csv
+import hashlib
+import io
 import json
+import os
 import pathlib
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
 from unittest.mock import patch
 from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
 from django.urls import reverse
 from django.test import Client, TestCase
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.http.multipartparser import MultiPartParser
+import requests
 import responses
+from requests.adapters import HTTPAdapter
 from bdrcommon.identity import BDR_ACCESS
 from .. import app_settings as settings
+from .. import clients
+from .. import http_client
+from .. import metrics
+from .. import search_index
+from ..caching import TTLCache
+from .. import content_models
+from .. import bulk_create
+from ..bulk import run_bulk
+from ..models import BDR_Collection, BulkCreateRow, StreamJob, collection_info_cache
+from ..ordering import changed_order_pairs, longest_increasing_subsequence
+from ..stream_jobs import poll_stream_job
+from ..thumbnails import evict
+from .. import validation
+from ..multipart import MultipartEncoder
+from ..export import stream_zip
+from ..object_data import DatastreamProfile, cached_object_data, has_usable_checksum, invalidate_object
 from ..views import _get_folders_param_from_collections
 from workshop_common import test_data
 
 
 CUR_DIR = pathlib.Path(__file__).parent
 
+DS_PROFILE_IN_LIST_PATTERN = '''<datastreamProfile pid="test:123" dsID="{ds_id}">
+    <dsLabel>{ds_id}</dsLabel>
+    <dsVersionID>{ds_id}.0</dsVersionID>
+    <dsCreateDate>2016-01-01T00:00:00.000Z</dsCreateDate>
+    <dsState>{ds_state}</dsState>
+    <dsMIME>{mimetype}</dsMIME>
+    <dsControlGroup>M</dsControlGroup>
+    <dsSize>{size}</dsSize>
+    <dsChecksumType>MD5</dsChecksumType>
+    <dsChecksum>{checksum}</dsChecksum>
+  </datastreamProfile>'''
+
+DS_PROFILE_WITH_CHECKSUM_PATTERN = '''<?xml version="1.0" encoding="UTF-8"?>
+<datastreamProfile xmlns="http://www.fedora.info/definitions/1/0/management/" pid="test:123" dsID="{ds_id}">
+  <dsLabel>{ds_id}</dsLabel>
+  <dsVersionID>{ds_id}.0</dsVersionID>
+  <dsCreateDate>2016-01-01T00:00:00.000Z</dsCreateDate>
+  <dsState>A</dsState>
+  <dsMIME>{mimetype}</dsMIME>
+  <dsControlGroup>M</dsControlGroup>
+  <dsSize>{size}</dsSize>
+  <dsChecksumType>MD5</dsChecksumType>
+  <dsChecksum>{checksum}</dsChecksum>
+</datastreamProfile>'''
+
+
+def datastream_profiles_xml(datastreams):
+    """build a listDatastreams?profiles=true response from (ds_id, ds_state) tuples"""
+    profiles = [
+            DS_PROFILE_IN_LIST_PATTERN.format(ds_id=ds_id, ds_state=ds_state, mimetype='text/xml', size=1024, checksum=f'{ds_id}-checksum')
+            for ds_id, ds_state in datastreams
+        ]
+    return '''<?xml version="1.0" encoding="UTF-8"?>
+<objectDatastreams xmlns="http://www.fedora.info/definitions/1/0/access/" pid="test:123" baseURL="http://testserver/fedora/">
+  %s
+</objectDatastreams>''' % '\n  '.join(profiles)
+
+
+class HttpClientTest(TestCase):
+
+    def test_session_per_thread_with_shared_pools(self):
+        session = http_client.get_session()
+        self.assertIs(http_client.get_session(), session)
+        other_thread_session = http_client.submit(http_client.get_session).result()
+        self.assertIsNot(other_thread_session, session)
+        self.assertIs(other_thread_session.get_adapter('http://'), session.get_adapter('http://'))
+
+    def test_new_session_after_fork(self):
+        session = http_client.get_session()
+        with patch('repo_direct_app.http_client.os.getpid', return_value=-1):
+            self.assertIsNot(http_client.get_session(), session)
+            self.assertIsNot(http_client.get_session().get_adapter('http://'), session.get_adapter('http://'))
+
+    @responses.activate
+    def test_default_timeouts(self):
+        responses.add(responses.GET, 'http://testserver/storage/test:123/irMetadata/', body='', status=200)
+        with patch.object(http_client.get_session(), 'request', wraps=http_client.get_session().request) as mock_request:
+            http_client.storage_get('test:123', 'irMetadata')
+        self.assertEqual(mock_request.call_args[1]['timeout'], (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+
+    @responses.activate
+    @patch('repo_direct_app.http_client.time.sleep')
+    def test_idempotent_retries(self, mock_sleep):
+        http_client.reset_breakers()
+        for status in [503, 200, 503]:
+            responses.add(responses.PUT, 'http://testserver/api/private/items/', body='{}', status=status)
+        r = http_client.item_api_put({'pid': 'test:123'}, idempotent=True)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertLessEqual(mock_sleep.call_args[0][0], settings.HTTP_RETRY_BACKOFF)
+        #not retried unless it's idempotent
+        r = http_client.item_api_put({'pid': 'test:123'})
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_circuit_breaker(self):
+        http_client.reset_breakers()
+        responses.add(responses.GET, 'http://testserver/storage/test:123/irMetadata/', body='', status=500)
+        for i in range(settings.BREAKER_MIN_CALLS):
+            http_client.storage_get('test:123', 'irMetadata')
+        with self.assertRaises(http_client.BackendDegraded):
+            http_client.storage_get('test:123', 'irMetadata')
+        self.assertEqual(len(responses.calls), settings.BREAKER_MIN_CALLS)
+        #other upstreams aren't affected
+        responses.add(responses.GET, f'{settings.THUMBNAIL_BASE_URL}/test:123/', body='', status=200)
+        http_client.thumbnail_get('test:123')
+        #after BREAKER_OPEN_SECONDS, one probe is let through - and it closes the breaker
+        responses.replace(responses.GET, 'http://testserver/storage/test:123/irMetadata/', body='', status=200)
+        with patch.object(settings, 'BREAKER_OPEN_SECONDS', 0):
+            self.assertEqual(http_client.storage_get('test:123', 'irMetadata').status_code, 200)
+        self.assertEqual(http_client.get_breaker('storage').state, http_client.CircuitBreaker.CLOSED)
+        http_client.storage_get('test:123', 'irMetadata')
+
+    def test_half_open_allows_one_probe(self):
+        breaker = http_client.CircuitBreaker('item_api')
+        breaker._open()
+        with patch.object(settings, 'BREAKER_OPEN_SECONDS', 0):
+            breaker.before_call()
+            with self.assertRaises(http_client.BackendDegraded):
+                breaker.before_call()
+            breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, http_client.CircuitBreaker.OPEN)
+
+
+class ClientsTest(TestCase):
+
+    def test_repo_per_thread(self):
+        repo = clients.get_repo()
+        self.assertIs(clients.get_repo(), repo)
+        other_thread_repo = http_client.submit(clients.get_repo).result()
+        self.assertIsNot(other_thread_repo, repo)
+
+    def test_new_clients_after_fork(self):
+        bdr_server = clients.get_bdr_server()
+        with patch('repo_direct_app.clients.os.getpid', return_value=-1):
+            self.assertIsNot(clients.get_bdr_server(), bdr_server)
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_fedora_endpoint(self):
+        self.assertEqual(metrics.fedora_endpoint('/fedora/objects/test:123/datastreams/MODS/content'), 'objects/{pid}/datastreams/{dsid}/content')
+        self.assertEqual(metrics.fedora_endpoint('/fedora/objects/test:123'), 'objects/{pid}')
+
+    @responses.activate
+    def test_upstream_calls_labelled_by_view(self):
+        responses_setup_for_display_view()
+        User.objects.create_user(username='x@brown.edu')
+        self.client.get(reverse('repo_direct:display', kwargs={'pid': 'test:123'}), **{
+                                'REMOTE_USER': 'x@brown.edu',
+                                'Shibboleth-eppn': 'x@brown.edu'})
+        with patch.object(settings, 'METRICS_TOKEN', 'secret'):
+            r = self.client.get(reverse('repo_direct:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, 'repo_direct_upstream_requests_total{upstream="fedora",endpoint="GET objects/{pid}/datastreams",view="display",status="200"} 1')
+        self.assertContains(r, 'repo_direct_upstream_request_duration_seconds_count{upstream="fedora",endpoint="GET objects/{pid}",view="display"} 1')
+        self.assertContains(r, 'repo_direct_upstream_in_flight{upstream="fedora"} 0')
+
+    @responses.activate
+    def test_timed_adapter_keeps_its_settings(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:1', body='', status=200)
+        session = requests.Session()
+        session.mount('http://', metrics.time_adapter(HTTPAdapter(max_retries=3, pool_maxsize=4), 'fedora', metrics.fedora_endpoint))
+        session.get('http://testserver/fedora/objects/test:1')
+        adapter = session.get_adapter('http://testserver/')
+        self.assertEqual((adapter.max_retries.total, adapter._pool_maxsize), (3, 4))
+        self.assertIn('endpoint="GET objects/{pid}",view="",status="200"} 1', metrics.render())
+
+    def test_timed_call_error(self):
+        with self.assertRaises(ValueError):
+            metrics.timed_call('storage', 'GET', int, 'x')
+        self.assertIn('repo_direct_upstream_requests_total{upstream="storage",endpoint="GET",view="",status="error"} 1', metrics.render())
+
+    def test_metrics_need_token_or_staff(self):
+        url = reverse('repo_direct:metrics')
+        #the address doesn't count - a local reverse proxy would make every request look local
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with patch.object(settings, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        User.objects.create_user(username='x@brown.edu')
+        self.assertEqual(self.client.get(url, REMOTE_USER='x@brown.edu').status_code, 403)
+        User.objects.create_user(username='staff@brown.edu', is_staff=True)
+        self.assertEqual(self.client.get(url, REMOTE_USER='staff@brown.edu').status_code, 200)
+
+
+class CollectionInfoCacheTest(TestCase):
+
+    def setUp(self):
+        collection_info_cache.clear()
+
+    @responses.activate
+    def test_folder_info_shared_across_instances(self):
+        responses.add(responses.GET, f'{settings.FOLDER_API_PUBLIC}1/',
+                      body=json.dumps({'name': 'Library', 'child_folders': [{'id': 2, 'name': 'Sub'}]}),
+                      status=200,
+                      content_type='application/json'
+                    )
+        self.assertEqual(BDR_Collection(1).name, 'Library')
+        self.assertEqual(BDR_Collection(1).subfolder_choices, [('2', 'Sub')])
+        self.assertEqual(len(responses.calls), 1)
+        BDR_Collection.invalidate(1)
+        self.assertEqual(BDR_Collection(1).name, 'Library')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_errors_not_cached(self):
+        responses.add(responses.GET, f'{settings.FOLDER_API_PUBLIC}1/', body='error', status=500)
+        self.assertEqual(BDR_Collection(1).name, 'No name available')
+        self.assertEqual(BDR_Collection(1).name, 'No name available')
+        self.assertEqual(len(responses.calls), 2)
+
+    def test_stale_value_served_while_refreshing(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        with patch('repo_direct_app.caching.time.monotonic', return_value=0):
+            self.assertEqual(cache.get('a', lambda: 'old'), 'old')
+        with patch('repo_direct_app.caching.time.monotonic', return_value=20), \
+                patch.object(cache, '_refresh_in_background') as mock_refresh:
+            self.assertEqual(cache.get('a', lambda: 'new'), 'old')
+            self.assertEqual(mock_refresh.call_count, 1)
+
+    def test_refresh_finishing_after_invalidate_not_stored(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        cache.set('a', 'old')
+        def slow_loader():
+            #the value gets invalidated (eg. after an edit) while this refresh is in flight
+            cache.invalidate('a')
+            return 'old'
+        cache._refresh('a', slow_loader)
+        self.assertEqual(cache.get('a', lambda: 'new'), 'new')
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a', lambda: None)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a', lambda: 'reloaded'), 1)
+        self.assertEqual(cache.get('b', lambda: 'reloaded'), 'reloaded')
+
+
+class MultipartEncoderTest(TestCase):
+
+    def test_file_read_in_chunks(self):
+        content_file = io.BytesIO(b'x' * 200000)
+        content_file.name = 'big.bin'
+        encoder = MultipartEncoder(fields={'pid': 'test:123'}, files=[('big.bin', content_file)], chunk_size=65536)
+        length = len(encoder)
+        chunks = list(encoder)
+        self.assertEqual(max(len(chunk) for chunk in chunks[2:-1]), 65536)
+        body = b''.join(chunks)
+        self.assertEqual(len(body), length)
+        meta = {'CONTENT_TYPE': encoder.content_type, 'CONTENT_LENGTH': str(len(body))}
+        post, files = MultiPartParser(meta, io.BytesIO(body), [MemoryFileUploadHandler()], 'utf-8').parse()
+        self.assertEqual(post['pid'], 'test:123')
+        self.assertEqual(files['big.bin'].name, 'big.bin')
+        self.assertEqual(files['big.bin'].read(), b'x' * 200000)
+
+    def test_buffer(self):
+        content = memoryview(b'<xml/>' * 20000)
+        encoder = MultipartEncoder(fields={'pid': 'test:123'}, files=[('DC.xml', content)], chunk_size=65536)
+        length = len(encoder)
+        chunks = list(encoder)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), length)
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(max(len(chunk) for chunk in chunks[2:-1]), 65536)
+        body = b''.join(chunks)
+        meta = {'CONTENT_TYPE': encoder.content_type, 'CONTENT_LENGTH': str(len(body))}
+        post, files = MultiPartParser(meta, io.BytesIO(body), [MemoryFileUploadHandler()], 'utf-8').parse()
+        self.assertEqual(files['DC.xml'].read(), content.tobytes())
+
+
+class ContentModelTest(TestCase):
+
+    def test_parse_content_models(self):
+        rels_ext = test_data.RELS_EXT_XML.format(cmodel='mp3').encode('utf8')
+        self.assertEqual(content_models.parse_content_models('test:123', rels_ext), frozenset(['info:fedora/bdr-cmodel:mp3']))
+        self.assertEqual(content_models.parse_content_models('test:456', rels_ext), frozenset())
+        self.assertEqual(content_models.parse_content_models('test:123', b''), frozenset())
+
+    def test_classify(self):
+        models = frozenset(['info:fedora/bdr-cmodel:implicit-set', 'info:fedora/bdr-cmodel:jp2'])
+        self.assertEqual(content_models.classify(models), frozenset([content_models.IMPLICIT_SET, content_models.IMAGE]))
+        self.assertEqual(content_models.classify(frozenset(['info:fedora/bdr-cmodel:pdf'])), frozenset())
+
+    def test_capabilities_cached_by_checksum(self):
+        rels_ext = test_data.RELS_EXT_XML.format(cmodel='video').encode('utf8')
+        self.assertEqual(content_models.get_capabilities('test:123', rels_ext), frozenset([content_models.AUDIO_VIDEO]))
+        with patch('repo_direct_app.content_models.parse_content_models') as mock_parse:
+            content_models.get_capabilities('test:123', rels_ext)
+            self.assertFalse(mock_parse.called)
+            mock_parse.return_value = frozenset()
+            self.assertEqual(content_models.get_capabilities('test:123', rels_ext.replace(b'video', b'pdf')), frozenset())
+
 
 class AccessTest(TestCase):
 
@@ -72,6 +384,53 @@ def responses_setup_for_display_view(object_type=None):
                 )
 
 
+#most outbound calls each view may make, by upstream - 'total' covers all of them.
+#  These don't depend on the number of datastreams or children.
+VIEW_CALL_BUDGETS = {
+    'display': {'fedora': 3, 'total': 3},
+    'xml_edit GET': {'fedora': 2, 'total': 2},
+    'xml_edit POST': {'item_api': 1, 'total': 1},
+    'file_edit POST': {'fedora': 1, 'item_api': 1, 'total': 2},
+    'edit_item_collection GET': {'storage': 1, 'total': 1},
+    'edit_item_collection POST': {'item_api': 1, 'total': 1},
+    'embargo POST': {'item_api': 1, 'total': 1},
+    'reorder POST': {'fedora': 1, 'reorder_api': 1, 'total': 2},
+    'reorder POST (full order)': {'reorder_api': 1, 'total': 1},
+    'datastream_history': {'fedora': 1, 'total': 1},
+}
+
+
+def _upstream_for_url(url):
+    upstream_prefixes = [
+        ('fedora', 'http://testserver/fedora/'),
+        ('item_api', settings.ITEM_POST_URL),
+        ('reorder_api', settings.REORDER_URL),
+        ('storage', settings.STORAGE_BASE_URL),
+        ('thumbnail', settings.THUMBNAIL_BASE_URL),
+        ('folder_api', settings.FOLDER_API_PUBLIC),
+    ]
+    for upstream, prefix in upstream_prefixes:
+        if url.startswith(prefix):
+            return upstream
+    return 'other'
+
+
+class UpstreamCallBudgetMixin:
+    """Check the outbound calls (recorded by responses) a view makes against its budget"""
+
+    @contextmanager
+    def assertWithinCallBudget(self, view_name):
+        budget = VIEW_CALL_BUDGETS[view_name]
+        first_call = len(responses.calls)
+        yield
+        urls = [call.request.url for call in list(responses.calls)[first_call:]]
+        counts = Counter(_upstream_for_url(url) for url in urls)
+        counts['total'] = len(urls)
+        for upstream, limit in budget.items():
+            self.assertLessEqual(counts[upstream], limit,
+                    f'{view_name} made {counts[upstream]} {upstream} calls (budget {limit}):\n' + '\n'.join(urls))
+
+
 class NewObjectTest(TestCase):
 
     def setUp(self):
@@ -105,10 +464,16 @@ class NewObjectTest(TestCase):
                                 'Shibboleth-eppn': 'someone@brown.edu'})
         self.assertRedirects(r, reverse('repo_direct:display', kwargs={'pid': 'test:123'}))
         self.assertContains(r, 'New object test:123 created')
+        item_post = [call.request.body for call in responses.calls if call.request.method == 'POST'][0]
+        self.assertIn('ir_collection_id%22%3A+123', item_post)
+        self.assertIn('owner_id', item_post)
 
 
 class DisplayTest(TestCase):
 
+    def setUp(self):
+        cache.clear()
+
     @responses.activate
     def test_get(self):
         responses_setup_for_display_view(object_type='audio')
@@ -136,6 +501,42 @@ class DisplayTest(TestCase):
         self.assertEqual(r.status_code, 200)
         self.assertNotContains(r, 'Create Streaming Derivative')
 
+    @responses.activate
+    def test_get_missing_object(self):
+        for url in ['http://testserver/fedora/objects/test:123',
+                    'http://testserver/fedora/objects/test:123/datastreams',
+                    'http://testserver/fedora/objects/test:123/datastreams/RELS-EXT/content']:
+            responses.add(responses.GET, url, body='Object not found', status=404)
+        User.objects.create_user(username='x@brown.edu')
+        url = reverse('repo_direct:display', kwargs={'pid': 'test:123'})
+        r = self.client.get(url, **{
+                                'REMOTE_USER': 'x@brown.edu',
+                                'Shibboleth-eppn': 'x@brown.edu'})
+        self.assertEqual(r.status_code, 404)
+
+    @responses.activate
+    def test_get_fedora_error_not_404(self):
+        for url in ['http://testserver/fedora/objects/test:123',
+                    'http://testserver/fedora/objects/test:123/datastreams',
+                    'http://testserver/fedora/objects/test:123/datastreams/RELS-EXT/content']:
+            responses.add(responses.GET, url, body='Internal error', status=500)
+        User.objects.create_user(username='x@brown.edu')
+        url = reverse('repo_direct:display', kwargs={'pid': 'test:123'})
+        from eulfedora.util import RequestFailed
+        with self.assertRaises(RequestFailed):
+            self.client.get(url, **{
+                                'REMOTE_USER': 'x@brown.edu',
+                                'Shibboleth-eppn': 'x@brown.edu'})
+
+    def test_object_data_stale_after_generation_evicted(self):
+        self.assertEqual(cached_object_data('test:123', 'profile', lambda: 'old'), 'old')
+        invalidate_object('test:123')
+        self.assertEqual(cached_object_data('test:123', 'profile', lambda: 'new'), 'new')
+        self.assertEqual(cached_object_data('test:123', 'profile', lambda: 'unused'), 'new')
+        #losing the generation (eg. LRU eviction) must make what's cached stale, not current
+        cache.delete('repo_direct:object:test:123:generation')
+        self.assertEqual(cached_object_data('test:123', 'profile', lambda: 'newer'), 'newer')
+
     @responses.activate
     def test_get_deleted_mods(self):
         responses.add(responses.GET, 'http://testserver/fedora/objects/test:123',
@@ -174,10 +575,202 @@ class DisplayTest(TestCase):
         self.assertInHTML('<a class="btn btn-primary" href="rightsMetadata/">View</a>', response_text)
         self.assertInHTML('<td>MODS deleted</td>', response_text)
 
+    @responses.activate
+    def test_get_datastream_profiles_single_call(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123',
+                      body=test_data.OBJECT_XML,
+                      status=200,
+                      content_type='text/xml'
+                    )
+        ds_ids = ['DC', 'RELS-EXT', 'rightsMetadata', 'irMetadata'] + ['EXTRA%s' % i for i in range(50)]
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams',
+                      body=datastream_profiles_xml([(ds_id, 'A') for ds_id in ds_ids] + [('MODS', 'D')]),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/RELS-EXT',
+                      body=test_data.DS_PROFILE_PATTERN.format(ds_id='RELS-EXT', ds_state='A'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/RELS-EXT/content',
+                      body=test_data.RELS_EXT_XML.format(cmodel='pdf'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        User.objects.create_user(username='x@brown.edu')
+        url = reverse('repo_direct:display', kwargs={'pid': 'test:123'})
+        r = self.client.get(url, **{
+                                'REMOTE_USER': 'x@brown.edu',
+                                'Shibboleth-eppn': 'x@brown.edu'})
+        self.assertEqual(r.status_code, 200)
+        response_text = r.content.decode('utf8')
+        self.assertInHTML('<a class="btn btn-primary" href="EXTRA49/">View</a>', response_text)
+        self.assertInHTML('<td>MODS deleted</td>', response_text)
+        self.assertContains(r, '1.0\xa0KB')
+        profile_urls = [call.request.url for call in responses.calls if '/datastreams/EXTRA' in call.request.url]
+        self.assertEqual(profile_urls, [])
+
+
+class ReorderTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('repo_direct:reorder', kwargs={'pid': 'test:123'})
+        User.objects.create(username='someone@brown.edu', password='x')
+
+    def test_longest_increasing_subsequence(self):
+        self.assertEqual(longest_increasing_subsequence([]), [])
+        self.assertEqual(longest_increasing_subsequence([3, 1, 2, 5, 4]), [1, 2, 4])
+
+    def test_changed_order_pairs(self):
+        current_orders = {f'test:{i}': i for i in range(1, 1001)}
+        new_pids = [f'test:{i}' for i in range(1, 1001)]
+        self.assertEqual(changed_order_pairs(current_orders, new_pids), [])
+        #swap two neighbours - only those two get renumbered
+        new_pids[10], new_pids[11] = new_pids[11], new_pids[10]
+        self.assertEqual(sorted(changed_order_pairs(current_orders, new_pids)), [('test:11', '12'), ('test:12', '11')])
+        #move the first page to the end - it fits after the last page
+        new_pids = [f'test:{i}' for i in range(2, 1001)] + ['test:1']
+        self.assertEqual(changed_order_pairs(current_orders, new_pids), [('test:1', '1001')])
+        #sparse orders leave room for moved pages between unmoved ones
+        current_orders = {'a': 10, 'b': 20, 'c': 30}
+        self.assertEqual(changed_order_pairs(current_orders, ['b', 'a', 'c']), [('b', '1')])
+        self.assertIsNone(changed_order_pairs(current_orders, ['a', 'b']))
+
+    def _mock_child_orders(self, child_count, status=200):
+        rows = ''.join(f'info:fedora/test:{i},{i}\n' for i in range(1, child_count+1))
+        responses.add(responses.GET, 'http://testserver/fedora/risearch', body=f'child,order\n{rows}', status=status, content_type='text/plain')
+
+    def _post(self, new_order):
+        return self.client.post(self.url, {'child_pids_ordered_list': ','.join(new_order)}, **{
+                                    'REMOTE_USER': 'someone@brown.edu',
+                                    'Shibboleth-eppn': 'someone@brown.edu'})
+
+    @responses.activate
+    def test_post_sends_only_moved_children(self):
+        self._mock_child_orders(1000)
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        new_order = [f'test:{i}' for i in range(2, 1001)] + ['test:1']
+        r = self._post(new_order)
+        self.assertRedirects(r, reverse('repo_direct:display', kwargs={'pid': 'test:123'}), fetch_redirect_response=False)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertIn('flush=true', responses.calls[0].request.url)
+        self.assertIn('hasPagination', responses.calls[0].request.params['query'])
+        self.assertIn('child_pairs=%5B%5B%22test%3A1%22%2C+%221001%22%5D%5D', responses.calls[1].request.body)
+
+    @responses.activate
+    def test_post_full_order_without_fedora_orders(self):
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        with patch.object(settings, 'REORDER_ORDER_PREDICATE', None):
+            self._post(['test:2', 'test:1', 'test:3'])
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn('test%3A3%22%2C+%223%22', responses.calls[0].request.body)
+
+    @responses.activate
+    def test_post_full_order_if_fedora_orders_fail(self):
+        self._mock_child_orders(3, status=500)
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        self._post(['test:2', 'test:1', 'test:3'])
+        self.assertIn('test%3A3%22%2C+%223%22', responses.calls[-1].request.body)
+
+    @responses.activate
+    def test_post_full_order_if_fedora_orders_dont_match(self):
+        #eg. the children's orders are under a different predicate
+        self._mock_child_orders(0)
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        with self.assertLogs('ingest', 'WARNING'):
+            self._post(['test:2', 'test:1', 'test:3'])
+        self.assertIn('test%3A3%22%2C+%223%22', responses.calls[-1].request.body)
+
+    @responses.activate
+    def test_post_full_order(self):
+        self._mock_child_orders(3)
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        with patch.object(settings, 'REORDER_SEND_FULL_ORDER', True):
+            self._post(['test:2', 'test:1', 'test:3'])
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn('test%3A3%22%2C+%223%22', responses.calls[0].request.body)
+
+
+class ThumbnailTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        patcher = patch.object(settings, 'THUMBNAIL_CACHE_DIR', self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        User.objects.create(username='someone@brown.edu', password='x')
+        self.headers = {'REMOTE_USER': 'someone@brown.edu', 'Shibboleth-eppn': 'someone@brown.edu'}
+        self.url = reverse('repo_direct:thumbnail', kwargs={'pid': 'test:1'})
+        self.thumbnail_url = f'{settings.THUMBNAIL_BASE_URL}/test:1/'
+        self.image = (CUR_DIR / 'test_files' / 'thumb.jpg').read_bytes()
+
+    @responses.activate
+    def test_cached(self):
+        responses.add(responses.GET, self.thumbnail_url, body=self.image, status=200, content_type='image/jpeg', headers={'ETag': '"v1"'})
+        r = self.client.get(self.url, **self.headers)
+        self.assertEqual(b''.join(r.streaming_content), self.image)
+        self.assertIn('max-age', r['Cache-Control'])
+        r = self.client.get(self.url, **self.headers)
+        self.assertEqual(b''.join(r.streaming_content), self.image)
+        self.assertEqual(len(responses.calls), 1)
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=r['ETag'], **self.headers)
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_revalidate(self):
+        responses.add(responses.GET, self.thumbnail_url, body=self.image, status=200, content_type='image/jpeg', headers={'ETag': '"v1"'})
+        self.client.get(self.url, **self.headers)
+        responses.replace(responses.GET, self.thumbnail_url, body=b'', status=304)
+        with patch.object(settings, 'THUMBNAIL_CACHE_REVALIDATE_AFTER', -1):
+            r = self.client.get(self.url, **self.headers)
+        self.assertEqual(b''.join(r.streaming_content), self.image)
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'], '"v1"')
+
+    @responses.activate
+    def test_missing(self):
+        responses.add(responses.GET, self.thumbnail_url, body='not found', status=404)
+        r = self.client.get(self.url, **self.headers)
+        self.assertEqual(r.status_code, 404)
+        #the 404 is remembered for a while
+        self.assertEqual(self.client.get(self.url, **self.headers).status_code, 404)
+        self.assertEqual(len(responses.calls), 1)
+        with patch.object(settings, 'THUMBNAIL_MISSING_CACHE_SECONDS', -1):
+            self.assertEqual(self.client.get(self.url, **self.headers).status_code, 404)
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_removed_upstream(self):
+        responses.add(responses.GET, self.thumbnail_url, body=self.image, status=200, content_type='image/jpeg', headers={'ETag': '"v1"'})
+        self.client.get(self.url, **self.headers)
+        responses.replace(responses.GET, self.thumbnail_url, body='not found', status=404)
+        with patch.object(settings, 'THUMBNAIL_CACHE_REVALIDATE_AFTER', -1):
+            r = self.client.get(self.url, **self.headers)
+        self.assertEqual(r.status_code, 404)
+        #an upstream failure after that doesn't bring the old thumbnail back
+        responses.replace(responses.GET, self.thumbnail_url, body='error', status=500)
+        with patch.object(settings, 'THUMBNAIL_MISSING_CACHE_SECONDS', -1):
+            self.assertEqual(self.client.get(self.url, **self.headers).status_code, 404)
+
+    @responses.activate
+    def test_evict_least_recently_used(self):
+        for pid in ['test:1', 'test:2', 'test:3']:
+            responses.add(responses.GET, f'{settings.THUMBNAIL_BASE_URL}/{pid}/', body=self.image, status=200, content_type='image/jpeg')
+            self.client.get(reverse('repo_direct:thumbnail', kwargs={'pid': pid}), **self.headers)
+        images = list(pathlib.Path(self.cache_dir).glob('*/*.img'))
+        for last_used, path in enumerate(images):
+            os.utime(path, (last_used, last_used))
+        evict(max_bytes=int(len(self.image) * 2.5))
+        self.assertEqual([path.exists() for path in images], [False, True, True])
+
 
 class EditItemCollectionTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.url = reverse('repo_direct:edit_item_collection', kwargs={'pid': 'test:123'})
 
     def test_auth(self):
@@ -234,6 +827,8 @@ class EditItemCollectionTest(TestCase):
 class EmbargoTest(TestCase):
 
     def setUp(self):
+        cache.clear()
+        http_client.reset_breakers()
         self.url = reverse('repo_direct:embargo', kwargs={'pid': 'test:123'})
 
     def test_auth(self):
@@ -265,10 +860,217 @@ class EmbargoTest(TestCase):
         self.assertRedirects(r, reverse('repo_direct:display', kwargs={'pid': 'test:123'}))
         self.assertContains(r, '2020 added.')
 
+    @responses.activate
+    def test_post_invalidates_cached_object(self):
+        responses_setup_for_display_view()
+        responses.add(responses.PUT, 'http://testserver/api/private/items/',
+                      body=json.dumps({}),
+                      status=200,
+                      content_type='application/json'
+                    )
+        User.objects.create(username='someone@brown.edu', password='x')
+        display_url = reverse('repo_direct:display', kwargs={'pid': 'test:123'})
+        auth = {'REMOTE_USER': 'someone@brown.edu', 'Shibboleth-eppn': 'someone@brown.edu'}
+        self.client.get(display_url, **auth)
+        fedora_calls = len([call for call in responses.calls if '/fedora/' in call.request.url])
+        self.client.get(display_url, **auth)
+        self.assertEqual(len([call for call in responses.calls if '/fedora/' in call.request.url]), fedora_calls)
+        self.client.post(self.url, {'new_embargo_end_year': 2020}, **auth)
+        self.client.get(display_url, **auth)
+        self.assertEqual(len([call for call in responses.calls if '/fedora/' in call.request.url]), fedora_calls * 2)
+
+    @responses.activate
+    def test_post_backend_degraded(self):
+        User.objects.create(username='someone@brown.edu', password='x')
+        http_client.get_breaker('item_api')._open()
+        r = self.client.post(self.url, {'new_embargo_end_year': 2020}, **{
+                                'REMOTE_USER': 'someone@brown.edu',
+                                'Shibboleth-eppn': 'someone@brown.edu'})
+        self.assertContains(r, "The item API isn't responding properly right now", status_code=503)
+        self.assertContains(r, 'Nothing was saved', status_code=503)
+        self.assertLessEqual(int(r['Retry-After']), settings.BREAKER_OPEN_SECONDS)
+        self.assertEqual(len(responses.calls), 0)
+
+
+class BulkEditTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        http_client.reset_breakers()
+        self.url = reverse('repo_direct:bulk_edit')
+        User.objects.create(username='someone@brown.edu', password='x')
+        self.headers = {'REMOTE_USER': 'someone@brown.edu', 'Shibboleth-eppn': 'someone@brown.edu'}
+
+    def _item_api_callback(self, request):
+        if 'test%3A2' in request.body:
+            return (500, {}, 'item API error')
+        return (200, {}, json.dumps({}))
+
+    def test_get(self):
+        r = self.client.get(self.url, **self.headers)
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, 'Bulk edit embargoes or collections')
+
+    @responses.activate
+    def test_post_pids(self):
+        responses.add_callback(responses.PUT, 'http://testserver/api/private/items/', callback=self._item_api_callback)
+        post_data = {'action': 'embargo', 'value': '2030', 'pids': 'test:1\ntest:2\ntest:3'}
+        r = self.client.post(self.url, post_data, **self.headers)
+        self.assertEqual(r.status_code, 200)
+        report = list(csv.reader(b''.join(r.streaming_content).decode('utf8').splitlines(keepends=True)))
+        self.assertEqual(report[0], ['pid', 'result', 'error'])
+        results = {row[0]: row[1] for row in report[1:]}
+        self.assertEqual(results, {'test:1': 'ok', 'test:2': 'failed', 'test:3': 'ok'})
+        self.assertEqual(len(responses.calls), 3)
+
+    def test_jobs_labelled_with_calling_view(self):
+        views_seen = []
+        with metrics.view_context('bulk_edit'):
+            results = run_bulk(lambda: views_seen.append(metrics.current_view()), [('test:1', ()), ('test:2', ())])
+        self.assertEqual(sorted(key for key, error in results), ['test:1', 'test:2'])
+        self.assertEqual(views_seen, ['bulk_edit', 'bulk_edit'])
+
+    @responses.activate
+    def test_post_csv(self):
+        responses.add(responses.PUT, 'http://testserver/api/private/items/', body=json.dumps({}), status=200)
+        csv_file = io.BytesIO(b'pid,value\ntest:1,"1,2"\ntest:3\n')
+        csv_file.name = 'pids.csv'
+        post_data = {'action': 'collections', 'value': '5', 'pids_file': csv_file}
+        r = self.client.post(self.url, post_data, **self.headers)
+        report = b''.join(r.streaming_content).decode('utf8')
+        self.assertIn('test:1,ok,', report)
+        self.assertIn('test:3,ok,', report)
+        request_bodies = sorted(call.request.body for call in responses.calls)
+        self.assertIn('1%231%2B2%232', request_bodies[0])
+        self.assertIn('5%235', request_bodies[1])
+
+    @responses.activate
+    def test_invalid_embargo_year_not_posted(self):
+        responses.add(responses.PUT, 'http://testserver/api/private/items/', body=json.dumps({}), status=200)
+        csv_file = io.BytesIO(b'pid,value\ntest:1,soon\ntest:2\n')
+        csv_file.name = 'pids.csv'
+        r = self.client.post(self.url, {'action': 'embargo', 'value': '2030', 'pids_file': csv_file}, **self.headers)
+        report = {row[0]: row for row in csv.reader(b''.join(r.streaming_content).decode('utf8').splitlines())}
+        self.assertEqual(report['test:1'][1], 'failed')
+        self.assertIn('invalid embargo end year "soon"', report['test:1'][2])
+        self.assertEqual(report['test:2'][1], 'ok')
+        self.assertEqual(len(responses.calls), 1)
+
+    def test_post_requires_pids(self):
+        r = self.client.post(self.url, {'action': 'embargo', 'value': '2030'}, **self.headers)
+        self.assertContains(r, 'Please enter pids or upload a CSV file.')
+
+    @responses.activate
+    def test_post_json_api(self):
+        responses.add_callback(responses.PUT, 'http://testserver/api/private/items/', callback=self._item_api_callback)
+        data = {'action': 'embargo', 'value': 2030, 'pids': ['test:1', 'test:2']}
+        r = self.client.post(self.url, json.dumps(data), content_type='application/json', **self.headers)
+        results = [json.loads(line) for line in b''.join(r.streaming_content).decode('utf8').splitlines()]
+        results = {result['pid']: result['ok'] for result in results}
+        self.assertEqual(results, {'test:1': True, 'test:2': False})
+        r = self.client.post(self.url, json.dumps({'action': 'delete', 'pids': []}), content_type='application/json', **self.headers)
+        self.assertEqual(r.status_code, 400)
+
+
+class BulkCreateTest(TestCase):
+
+    def setUp(self):
+        http_client.reset_breakers()
+        self.url = reverse('repo_direct:bulk_create')
+        User.objects.create(username='someone@brown.edu', password='x')
+        self.headers = {'REMOTE_USER': 'someone@brown.edu', 'Shibboleth-eppn': 'someone@brown.edu'}
+        self.csv_content = b'title,collection_id,mods\nFirst,12\nSecond\n,,<mods:mods xmlns:mods="http://www.loc.gov/mods/v3"/>\n'
+        self.fail_second = True
+
+    def _item_api_callback(self, request):
+        if self.fail_second and 'Second' in request.body:
+            return (500, {}, 'item API error')
+        return (200, {}, json.dumps({'pid': 'test:%s' % len(responses.calls)}))
+
+    def _post(self, **data):
+        csv_file = io.BytesIO(self.csv_content)
+        csv_file.name = 'objects.csv'
+        r = self.client.post(self.url, dict(data, csv_file=csv_file), **self.headers)
+        self.assertEqual(r.status_code, 200)
+        report = list(csv.DictReader(b''.join(r.streaming_content).decode('utf8').splitlines()))
+        return {row['row']: row for row in report}
+
+    def test_parse_rows(self):
+        self.assertEqual(bulk_create.parse_create_rows(self.csv_content), [
+                (2, 'First', 12, ''),
+                (3, 'Second', None, ''),
+                (4, '', None, '<mods:mods xmlns:mods="http://www.loc.gov/mods/v3"/>'),
+            ])
+        with self.assertRaises(ValueError):
+            bulk_create.parse_create_rows(b'title,collection_id\nFirst,abc\n')
+
+    @responses.activate
+    def test_post_and_resume(self):
+        responses.add_callback(responses.POST, 'http://testserver/api/private/items/', callback=self._item_api_callback)
+        report = self._post()
+        self.assertEqual({row: result['result'] for row, result in report.items()}, {'2': 'created', '3': 'failed', '4': 'created'})
+        self.assertIn('item API error', report['3']['error'])
+        self.assertEqual(len(responses.calls), 3)
+        mods_request = [call.request.body for call in responses.calls if 'xml_data' in call.request.body]
+        self.assertEqual(len(mods_request), 1)
+        #the same CSV again - only the failed row is posted
+        self.fail_second = False
+        report = self._post()
+        self.assertEqual({row: result['result'] for row, result in report.items()}, {'2': 'already created', '3': 'created', '4': 'already created'})
+        self.assertEqual(report['2']['pid'], BulkCreateRow.objects.get(row_number=2).pid)
+        self.assertEqual(len(responses.calls), 4)
+
+    @responses.activate
+    def test_interrupted_row_not_reposted(self):
+        responses.add_callback(responses.POST, 'http://testserver/api/private/items/', callback=self._item_api_callback)
+        self.fail_second = False
+        batch = bulk_create.batch_id_for(self.csv_content)
+        BulkCreateRow.objects.create(batch=batch, row_number=3, title='Second', status=BulkCreateRow.POSTING, submitter='x')
+        report = self._post()
+        self.assertEqual(report['3']['result'], 'interrupted')
+        self.assertEqual(len(responses.calls), 2)
+        report = self._post(retry_interrupted='on')
+        self.assertEqual(report['3']['result'], 'created')
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_row_claimed_by_another_run_skipped(self):
+        responses.add(responses.POST, 'http://testserver/api/private/items/', body=json.dumps({'pid': 'test:1'}), status=200)
+        rows = bulk_create.register_rows('batch', [(1, 'A', None, ''), (2, 'B', None, '')], 'x')
+        #another run of the batch claims row 1 after this one read it
+        BulkCreateRow.objects.filter(batch='batch', row_number=1).update(status=BulkCreateRow.POSTING)
+        results = [(row.row_number, result) for row, result in bulk_create._post_rows(rows, 1)]
+        self.assertEqual(results, [(1, 'skipped'), (2, 'created')])
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn('title%22%3A+%22B', responses.calls[0].request.body)
+
+    def test_rows_registered_by_another_run_kept(self):
+        bulk_create.register_rows('batch', [(1, 'A', None, '')], 'x')
+        rows = bulk_create.register_rows('batch', [(1, 'changed', None, ''), (2, 'B', None, '')], 'y')
+        self.assertEqual([(row.row_number, row.title, row.submitter) for row in rows], [(1, 'A', 'x'), (2, 'B', 'y')])
+
+    def test_invalid_csv(self):
+        csv_file = io.BytesIO(b'First,abc\n')
+        csv_file.name = 'objects.csv'
+        r = self.client.post(self.url, {'csv_file': csv_file}, **self.headers)
+        self.assertContains(r, 'invalid collection id')
+
+    @responses.activate
+    def test_command(self):
+        responses.add(responses.POST, 'http://testserver/api/private/items/', body=json.dumps({'pid': 'test:1'}), status=200)
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            f.write(b'Only\n')
+            f.flush()
+            out = io.StringIO()
+            call_command('bulk_create_objects', f.name, '--batch', 'onboarding', stdout=out, stderr=io.StringIO())
+        self.assertIn('1,Only,created,test:1,', out.getvalue())
+        self.assertEqual(BulkCreateRow.objects.get(batch='onboarding').status, BulkCreateRow.CREATED)
+
 
 class CreateStreamTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.url = reverse('repo_direct:create_stream', kwargs={'pid': 'test:123'})
 
     def test_auth(self):
@@ -296,11 +1098,140 @@ class CreateStreamTest(TestCase):
         self.assertRedirects(r, reverse('repo_direct:display', kwargs={'pid': 'test:123'}))
         self.assertContains(r, 'Queued streaming derivative job')
         mock_method.assert_called_once_with('test:123', visibility=BDR_ACCESS.brown_only.name)
+        job = StreamJob.objects.get(pid='test:123')
+        self.assertEqual(job.submitter, 'someone@brown.edu')
+        self.assertEqual(job.status, StreamJob.QUEUED)
+        self.assertContains(r, 'someone@brown.edu')
+
+    @patch('repo_direct_app.views._queue_stream_job')
+    def test_post_refused_while_in_flight(self, mock_method):
+        #no status service (the default) - an earlier job still blocks a resubmission for a while
+        User.objects.create(username='someone@brown.edu', password='x')
+        StreamJob.objects.create(pid='test:123', visibility=BDR_ACCESS.public.name, submitter='other@brown.edu')
+        r = self.client.post(self.url, {'visibility': BDR_ACCESS.brown_only.name}, **{
+                                'REMOTE_USER': 'someone@brown.edu',
+                                'Shibboleth-eppn': 'someone@brown.edu'})
+        self.assertContains(r, 'already in progress')
+        mock_method.assert_not_called()
+        self.assertEqual(StreamJob.objects.filter(pid='test:123').count(), 1)
+
+    @patch('repo_direct_app.views._queue_stream_job')
+    def test_post_allowed_after_dedupe_window(self, mock_method):
+        User.objects.create(username='someone@brown.edu', password='x')
+        earlier_job = StreamJob.objects.create(pid='test:123', visibility=BDR_ACCESS.public.name, submitter='other@brown.edu')
+        with patch.object(settings, 'STREAM_JOB_DEDUPE_SECONDS', -1):
+            r = self.client.post(self.url, {'visibility': BDR_ACCESS.brown_only.name}, **{
+                                    'REMOTE_USER': 'someone@brown.edu',
+                                    'Shibboleth-eppn': 'someone@brown.edu'})
+        self.assertEqual(r.status_code, 302)
+        mock_method.assert_called_once_with('test:123', visibility=BDR_ACCESS.brown_only.name)
+        earlier_job.refresh_from_db()
+        self.assertEqual(earlier_job.status, StreamJob.EXPIRED)
+
+    @patch('repo_direct_app.views._queue_stream_job')
+    def test_post_submit_anyway_supersedes_job(self, mock_method):
+        User.objects.create(username='someone@brown.edu', password='x')
+        earlier_job = StreamJob.objects.create(pid='test:123', visibility=BDR_ACCESS.public.name, submitter='other@brown.edu')
+        r = self.client.post(self.url, {'visibility': BDR_ACCESS.brown_only.name, 'submit_anyway': 'on'}, **{
+                                'REMOTE_USER': 'someone@brown.edu',
+                                'Shibboleth-eppn': 'someone@brown.edu'})
+        self.assertEqual(r.status_code, 302)
+        mock_method.assert_called_once_with('test:123', visibility=BDR_ACCESS.brown_only.name)
+        earlier_job.refresh_from_db()
+        self.assertEqual(earlier_job.status, StreamJob.EXPIRED)
+        self.assertIn('superseded', earlier_job.status_detail)
+        self.assertEqual(StreamJob.in_flight('test:123').get().visibility, BDR_ACCESS.brown_only.name)
+
+    @patch('repo_direct_app.views._queue_stream_job', side_effect=Exception('item API error'))
+    def test_failed_submission_not_left_in_flight(self, mock_method):
+        User.objects.create(username='someone@brown.edu', password='x')
+        with self.assertRaises(Exception):
+            self.client.post(self.url, {'visibility': BDR_ACCESS.brown_only.name}, **{
+                                'REMOTE_USER': 'someone@brown.edu',
+                                'Shibboleth-eppn': 'someone@brown.edu'})
+        self.assertEqual(StreamJob.objects.get(pid='test:123').status, StreamJob.FAILED)
+        self.assertFalse(StreamJob.in_flight('test:123').exists())
+
+
+class SearchIndexTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.index_dir = tempfile.mkdtemp()
+        index_path_patch = patch.object(settings, 'SEARCH_INDEX_PATH', os.path.join(self.index_dir, 'search.sqlite3'))
+        index_path_patch.start()
+        self.addCleanup(index_path_patch.stop)
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        User.objects.create_user(username='x@brown.edu')
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+
+    def test_index_and_search(self):
+        search_index.index_object('test:123', title='Annual report of the library', collection_ids=['12'])
+        search_index.index_object('test:456', title='Library minutes')
+        self.assertEqual(search_index.search('annual rep'), [{'pid': 'test:123', 'title': 'Annual report of the library'}])
+        self.assertEqual([result['pid'] for result in search_index.search('test:12')], ['test:123'])
+        self.assertEqual(len(search_index.search('librar')), 2)
+        self.assertEqual(search_index.search('12'), [{'pid': 'test:123', 'title': 'Annual report of the library'}])
+        #updating collections keeps the title
+        search_index.index_object('test:123', collection_ids=['34'])
+        self.assertEqual(search_index.search('34'), [{'pid': 'test:123', 'title': 'Annual report of the library'}])
+        self.assertEqual(search_index.search('12'), [])
+        self.assertEqual(search_index.search('"*'), [])
+
+    @responses.activate
+    def test_display_indexes_object(self):
+        responses_setup_for_display_view()
+        self.client.get(reverse('repo_direct:display', kwargs={'pid': 'test:123'}), **self.auth)
+        r = self.client.get(reverse('repo_direct:search'), {'q': 'test obj'}, **self.auth)
+        self.assertEqual(r.json(), {'results': [{'pid': 'test:123', 'title': 'Test object'}]})
+
+    @responses.activate
+    def test_backfill_command(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects',
+                      body='''<result xmlns="http://www.fedora.info/definitions/1/0/types/"><resultList>
+                        <objectFields><pid>test:1</pid><label>First thing</label></objectFields>
+                        <objectFields><pid>test:2</pid><label>Second thing</label></objectFields>
+                        </resultList></result>''',
+                      status=200,
+                      content_type='text/xml'
+                    )
+        out = io.StringIO()
+        call_command('backfill_search_index', stdout=out)
+        self.assertIn('indexed 2 objects', out.getvalue())
+        self.assertEqual(sorted(result['pid'] for result in search_index.search('thing')), ['test:1', 'test:2'])
+
+
+class StreamJobPollTest(TestCase):
+
+    @responses.activate
+    def test_poll_status(self):
+        responses.add(responses.GET, 'http://testserver/api/private/stream_jobs/test:123/',
+                      body=json.dumps({'status': 'complete', 'detail': 'done'}),
+                      status=200,
+                      content_type='application/json'
+                    )
+        job = StreamJob.objects.create(pid='test:123', visibility=BDR_ACCESS.public.name, submitter='x@brown.edu')
+        with patch.object(settings, 'STREAM_JOB_STATUS_URL', 'http://testserver/api/private/stream_jobs/{pid}/'):
+            poll_stream_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StreamJob.COMPLETE)
+        self.assertEqual(job.status_detail, 'done')
+        self.assertIsNotNone(job.last_checked)
+        self.assertFalse(StreamJob.in_flight('test:123').exists())
+
+    def test_expiry(self):
+        job = StreamJob.objects.create(pid='test:123', visibility=BDR_ACCESS.public.name, submitter='x@brown.edu')
+        #no status service - the dedupe window is all there is to go on
+        with patch.object(settings, 'STREAM_JOB_DEDUPE_SECONDS', -1):
+            poll_stream_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StreamJob.EXPIRED)
 
 
 class AddContentFileTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.url = reverse('repo_direct:add_content_file', kwargs={'pid': 'test:123'})
 
     def test_auth(self):
@@ -353,10 +1284,359 @@ class AddContentFileTest(TestCase):
         self.assertContains(r, 'Added content')
 
 
+class UploadChecksumTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='x@brown.edu')
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+        self.url = reverse('repo_direct:file-edit', kwargs={'pid': 'test:123', 'dsid': 'MASTER'})
+        self.content = b'master content' * 1000
+        profile = DS_PROFILE_IN_LIST_PATTERN.format(ds_id='MASTER', ds_state='A', mimetype='image/tiff',
+                size=len(self.content), checksum=hashlib.md5(self.content).hexdigest())
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams',
+                      body=datastream_profiles_xml([('DC', 'A')]).replace('</objectDatastreams>', profile + '</objectDatastreams>'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.PUT, 'http://testserver/api/private/items/',
+                      body=json.dumps({}),
+                      status=200,
+                      content_type='application/json'
+                    )
+
+    def _post(self, content):
+        upload = io.BytesIO(content)
+        upload.name = 'master.tif'
+        r = self.client.post(self.url, {'replacement_file': upload}, **self.auth)
+        self.assertRedirects(r, reverse('repo_direct:display', kwargs={'pid': 'test:123'}), fetch_redirect_response=False)
+        return [str(message) for message in get_messages(r.wsgi_request)]
+
+    def _item_api_calls(self):
+        return [call for call in responses.calls if call.request.url.startswith(settings.ITEM_POST_URL)]
+
+    def _add_current_profile(self, content):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER',
+                      body=DS_PROFILE_WITH_CHECKSUM_PATTERN.format(ds_id='MASTER', mimetype='image/tiff',
+                            size=len(content), checksum=hashlib.md5(content).hexdigest()),
+                      status=200,
+                      content_type='text/xml'
+                    )
+
+    @responses.activate
+    def test_identical_upload_skipped(self):
+        self._add_current_profile(self.content)
+        [message] = self._post(self.content)
+        self.assertIn('identical to the current MASTER content', message)
+        self.assertEqual(self._item_api_calls(), [])
+
+    @responses.activate
+    def test_upload_written_if_cached_profile_out_of_date(self):
+        #the content changed since the profiles were cached - the upload matches the old content
+        self._add_current_profile(b'changed elsewhere')
+        [message] = self._post(self.content)
+        self.assertIn('Saved new MASTER content.', message)
+        self.assertEqual(len(self._item_api_calls()), 1)
+
+    @responses.activate
+    def test_changed_upload_sends_checksum(self):
+        bodies = []
+        def item_api_callback(request):
+            #the body is streamed from the upload, so read it while that's still open
+            bodies.append(b''.join(request.body))
+            return (200, {}, json.dumps({}))
+        responses.remove(responses.PUT, 'http://testserver/api/private/items/')
+        responses.add_callback(responses.PUT, 'http://testserver/api/private/items/', callback=item_api_callback)
+        new_content = b'new content'
+        [message] = self._post(new_content)
+        self.assertIn('Saved new MASTER content.', message)
+        [body] = bodies
+        [call] = self._item_api_calls()
+        self.assertEqual(call.request.headers['Content-Length'], str(len(body)))
+        self.assertNotIn('Transfer-Encoding', call.request.headers)
+        self.assertIn(b'"checksumType": "MD5"', body)
+        self.assertIn(hashlib.md5(new_content).hexdigest().encode('utf8'), body)
+
+
+class RawDatastreamTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='x@brown.edu')
+        self.url = reverse('repo_direct:raw-datastream', kwargs={'pid': 'test:123', 'dsid': 'MASTER'})
+        self.content = bytes(range(256)) * 40
+
+    def _add_fedora_responses(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER',
+                      body=DS_PROFILE_WITH_CHECKSUM_PATTERN.format(ds_id='MASTER', mimetype='audio/x-wav', size=len(self.content), checksum='abc123'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        #fedora ignoring the Range header and sending everything
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER/content',
+                      body=self.content,
+                      status=200,
+                      content_type='audio/x-wav'
+                    )
+
+    def _get(self, **headers):
+        headers.update({'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'})
+        return self.client.get(self.url, **headers)
+
+    @responses.activate
+    def test_full_content(self):
+        self._add_fedora_responses()
+        r = self._get()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b''.join(r.streaming_content), self.content)
+        self.assertEqual(r['ETag'], '"abc123"')
+        self.assertEqual(r['Content-Type'], 'audio/x-wav')
+        self.assertEqual(r['Last-Modified'], 'Fri, 01 Jan 2016 00:00:00 GMT')
+
+    @responses.activate
+    def test_not_modified(self):
+        self._add_fedora_responses()
+        r = self._get(HTTP_IF_NONE_MATCH='"abc123"')
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_content_changed_outside_repo_direct(self):
+        self._add_fedora_responses()
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"abc123"').status_code, 304)
+        #eg. a derivative job rewrote the datastream - the old ETag mustn't match any more
+        responses.replace(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER',
+                      body=DS_PROFILE_WITH_CHECKSUM_PATTERN.format(ds_id='MASTER', mimetype='audio/x-wav', size=len(self.content), checksum='def456'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        r = self._get(HTTP_IF_NONE_MATCH='"abc123"')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['ETag'], '"def456"')
+
+    @responses.activate
+    def test_range(self):
+        self._add_fedora_responses()
+        r = self._get(HTTP_RANGE='bytes=100-4195')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r['Content-Range'], f'bytes 100-4195/{len(self.content)}')
+        self.assertEqual(b''.join(r.streaming_content), self.content[100:4196])
+        self.assertEqual(responses.calls[1].request.headers['Range'], 'bytes=100-4195')
+        r = self._get(HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(r.streaming_content), self.content[-10:])
+
+    @responses.activate
+    def test_range_not_satisfiable(self):
+        self._add_fedora_responses()
+        r = self._get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(r.status_code, 416)
+        self.assertEqual(r['Content-Range'], f'bytes */{len(self.content)}')
+
+    @responses.activate
+    def test_old_version(self):
+        self._add_fedora_responses()
+        self.url += '?asOfDateTime=2016-01-01T00:00:00.000Z'
+        with patch.object(settings, 'RAW_DATASTREAM_VERSION_MAX_AGE', 123):
+            r = self._get()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b''.join(r.streaming_content), self.content)
+        self.assertEqual(r['Cache-Control'], 'private, max-age=123')
+        for call in responses.calls:
+            self.assertIn('asOfDateTime=2016-01-01T00%3A00%3A00', call.request.url)
+
+    def test_invalid_version_date(self):
+        self.url += '?asOfDateTime=yesterday'
+        r = self._get()
+        self.assertEqual(r.status_code, 400)
+
+
+def datastream_history_xml(version_count):
+    profiles = [
+            DS_PROFILE_IN_LIST_PATTERN.format(ds_id=f'MASTER.{i}', ds_state='A', mimetype='audio/x-wav', size=1024, checksum=f'checksum{i}')
+                .replace('2016-01-01T00:00:00.000Z', f'2016-01-01T00:00:{i:02}.000Z')
+            for i in reversed(range(version_count))
+        ]
+    return '''<?xml version="1.0" encoding="UTF-8"?>
+<datastreamHistory xmlns="http://www.fedora.info/definitions/1/0/management/" pid="test:123" dsID="MASTER">
+  %s
+</datastreamHistory>''' % '\n  '.join(profiles)
+
+
+class DatastreamHistoryTest(UpstreamCallBudgetMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='x@brown.edu')
+        self.url = reverse('repo_direct:datastream-history', kwargs={'pid': 'test:123', 'dsid': 'MASTER'})
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+
+    @responses.activate
+    def test_pages(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER/history',
+                      body=datastream_history_xml(30),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        with self.assertWithinCallBudget('datastream_history'):
+            r = self.client.get(self.url, **self.auth)
+            self.assertEqual(r.status_code, 200)
+            self.assertContains(r, '30 versions')
+            self.assertContains(r, 'MASTER.29.0<')
+            self.assertNotContains(r, 'MASTER.4.0<')
+            self.assertContains(r, '?asOfDateTime=2016-01-01T00%3A00%3A29.000Z')
+            r = self.client.get(self.url, {'page': 2}, **self.auth)
+            self.assertContains(r, 'MASTER.4.0<')
+            self.assertContains(r, 'MASTER.0.0<')
+            self.assertNotContains(r, 'MASTER.5.0<')
+
+    @responses.activate
+    def test_not_found(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER/history',
+                      body='not found',
+                      status=404,
+                    )
+        r = self.client.get(self.url, **self.auth)
+        self.assertEqual(r.status_code, 404)
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='x@brown.edu')
+        self.url = reverse('repo_direct:export', kwargs={'pid': 'test:123'})
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+        self.contents = {'DC': b'<dc/>', 'MASTER': bytes(range(256)) * 1000}
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams',
+                      body=datastream_profiles_xml([('DC', 'A'), ('MASTER', 'A'), ('OLD', 'D')]),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        for dsid, content in self.contents.items():
+            responses.add(responses.GET, f'http://testserver/fedora/objects/test:123/datastreams/{dsid}/content',
+                          body=content,
+                          status=200,
+                          content_type='text/xml'
+                        )
+
+    def _archive(self, r):
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(r.streaming_content)))
+
+    def _assert_aborted(self, r, error):
+        sent = []
+        with self.assertRaises(error), self.assertLogs('ingest', 'ERROR'):
+            for chunk in r.streaming_content:
+                sent.append(chunk)
+        self.assertTrue(sent)
+        with self.assertRaises(zipfile.BadZipFile):
+            zipfile.ZipFile(io.BytesIO(b''.join(sent)))
+
+    @responses.activate
+    def test_active_datastreams(self):
+        r = self.client.get(self.url, **self.auth)
+        self.assertEqual(r['Content-Disposition'], 'attachment; filename="test_123.zip"')
+        archive = self._archive(r)
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['DC.xml', 'MASTER.xml', 'manifest-sha256.txt', 'fedora-checksums.txt'])
+        self.assertEqual(archive.read('MASTER.xml'), self.contents['MASTER'])
+        self.assertIn(f"{hashlib.sha256(self.contents['MASTER']).hexdigest()}  MASTER.xml\n", archive.read('manifest-sha256.txt').decode('utf8'))
+        self.assertIn('DC.xml\tMD5\tDC-checksum\n', archive.read('fedora-checksums.txt').decode('utf8'))
+
+    @responses.activate
+    def test_chosen_datastreams(self):
+        archive = self._archive(self.client.get(self.url, {'dsid': 'DC'}, **self.auth))
+        self.assertEqual(archive.namelist(), ['DC.xml', 'manifest-sha256.txt', 'fedora-checksums.txt'])
+        r = self.client.get(self.url, {'dsid': 'NOPE'}, **self.auth)
+        self.assertEqual(r.status_code, 400)
+
+    def test_fedora_checksums_without_usable_checksum(self):
+        profile = DatastreamProfile(dsid='DC', label='', state='A', mimetype='text/xml', size=5, created='',
+                control_group='X', version_id='DC.0', checksum_type='MD5', checksum='none')
+        self.assertFalse(has_usable_checksum(profile))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_zip([(profile, [b'<dc/>'])]))))
+        self.assertEqual(archive.read('fedora-checksums.txt').decode('utf8'), 'DC.xml\tDISABLED\tnone\n')
+
+    @responses.activate
+    def test_repeated_dsid_exported_once(self):
+        archive = self._archive(self.client.get(self.url, {'dsid': ['DC', 'MASTER', 'DC']}, **self.auth))
+        self.assertEqual(archive.namelist(), ['DC.xml', 'MASTER.xml', 'manifest-sha256.txt', 'fedora-checksums.txt'])
+
+    @responses.activate
+    def test_fedora_failure_aborts_download(self):
+        from eulfedora.util import RequestFailed
+        responses.replace(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MASTER/content', body='error', status=500)
+        self._assert_aborted(self.client.get(self.url, **self.auth), RequestFailed)
+
+    @responses.activate
+    def test_failure_partway_through_content_aborts_download(self):
+        r = self.client.get(self.url, **self.auth)
+        def fail_partway(chunk_size):
+            yield self.contents['MASTER'][:chunk_size]
+            raise requests.exceptions.ChunkedEncodingError('connection broken')
+        with patch('requests.models.Response.iter_content', side_effect=fail_partway):
+            self._assert_aborted(r, requests.exceptions.ChunkedEncodingError)
+
+
+TEST_XSD = '''<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="note">
+    <xs:complexType><xs:sequence><xs:element name="to" type="xs:string"/></xs:sequence></xs:complexType>
+  </xs:element>
+</xs:schema>'''
+
+
+class XMLValidationTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='x@brown.edu')
+        schema_file = tempfile.NamedTemporaryFile(suffix='.xsd', delete=False)
+        schema_file.write(TEST_XSD.encode('utf8'))
+        schema_file.close()
+        self.addCleanup(os.unlink, schema_file.name)
+        patcher = patch.object(settings, 'XML_SCHEMAS', {'MODS': schema_file.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        validation._schemas.clear()
+        self.url = reverse('repo_direct:xml-edit', kwargs={'pid': 'test:123', 'dsid': 'MODS'})
+
+    def _post(self, xml_content):
+        return self.client.post(self.url, {'xml_content': xml_content}, **{'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'})
+
+    def test_validate_xml(self):
+        self.assertEqual(validation.validate_xml('MODS', '<note><to>x</to></note>'), [])
+        self.assertIn('not well-formed', validation.validate_xml('MODS', '<note>')[0])
+        self.assertEqual(len(validation.validate_xml('MODS', '<note><from>x</from></note>')), 1)
+        self.assertEqual(validation.validate_xml('DC', '<anything/>'), [])
+
+    def test_schema_compiled_once(self):
+        with patch('repo_direct_app.validation._compile_schema', wraps=validation._compile_schema) as mock_compile:
+            for i in range(3):
+                validation.validate_xml('MODS', '<note><to>x</to></note>')
+        self.assertEqual(mock_compile.call_count, 1)
+
+    @responses.activate
+    def test_invalid_post_not_sent_to_api(self):
+        r = self._post('<note><from>x</from></note>')
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, 'line 1:')
+        r = self._post('<note>')
+        self.assertContains(r, 'XML is not well-formed')
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_valid_post(self):
+        responses.add(responses.PUT, 'http://testserver/api/private/items/', body=json.dumps({}), status=200)
+        r = self._post('<note><to>x</to></note>')
+        self.assertRedirects(r, reverse('repo_direct:display', args=('test:123',)), fetch_redirect_response=False)
+        self.assertEqual(len(responses.calls), 1)
+
+
 class DatastreamEditorTest(TestCase):
 
     def setUp(self):
         User.objects.create_user(username='x@brown.edu')
+        cache.clear()
 
     def _common_edit_test(self, reverse_name, dsid):
         r = self.client.get(
@@ -380,6 +1660,11 @@ class DatastreamEditorTest(TestCase):
                   status=200,
                   content_type='text/xml'
                 )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/rightsMetadata',
+                      body=test_data.DS_PROFILE_PATTERN.format(ds_id='rightsMetadata', ds_state='A'),
+                      status=200,
+                      content_type='text/xml'
+                    )
         responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/rightsMetadata/content',
                       body=test_data.RIGHTS_XML,
                       status=200,
@@ -394,6 +1679,11 @@ class DatastreamEditorTest(TestCase):
                   status=200,
                   content_type='text/xml'
                 )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/irMetadata',
+                      body=test_data.DS_PROFILE_PATTERN.format(ds_id='irMetadata', ds_state='A'),
+                      status=200,
+                      content_type='text/xml'
+                    )
         responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/irMetadata/content',
                       body=test_data.IR_METADATA_XML,
                       status=200,
@@ -401,6 +1691,39 @@ class DatastreamEditorTest(TestCase):
                     )
         self._common_edit_test('xml-edit', 'irMetadata')
 
+    @responses.activate
+    def test_large_xml_opens_read_only(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/METS',
+                      body=DS_PROFILE_WITH_CHECKSUM_PATTERN.format(ds_id='METS', mimetype='text/xml', size=50*1024*1024, checksum='abc'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        url = reverse('repo_direct:xml-edit', kwargs={'pid': 'test:123', 'dsid': 'METS'})
+        r = self.client.get(url, **{'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'})
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, 'Open in full editor anyway')
+        self.assertNotContains(r, 'xml_content')
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_pretty_xml_cached_by_checksum(self):
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/DC',
+                      body=DS_PROFILE_WITH_CHECKSUM_PATTERN.format(ds_id='DC', mimetype='text/xml', size=100, checksum='unchanged-checksum'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/DC/content',
+                      body=test_data.DC_XML.format(PID='test:123'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        url = reverse('repo_direct:xml-edit', kwargs={'pid': 'test:123', 'dsid': 'DC'})
+        for i in range(2):
+            r = self.client.get(url, **{'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'})
+            self.assertContains(r, 'test:123')
+        content_calls = [call for call in responses.calls if call.request.url.endswith('/content')]
+        self.assertEqual(len(content_calls), 1)
+
     def test_mods_xml_edit(self):
         url = reverse('repo_direct:xml-edit', kwargs={'pid': 'test:123', 'dsid': 'MODS'})
         r = self.client.head(url,
@@ -422,6 +1745,11 @@ class DatastreamEditorTest(TestCase):
                   status=200,
                   content_type='text/xml'
                 )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/DC',
+                      body=test_data.DS_PROFILE_PATTERN.format(ds_id='DC', ds_state='A'),
+                      status=200,
+                      content_type='text/xml'
+                    )
         responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/DC/content',
                       body=test_data.DC_XML.format(PID='test:123'),
                       status=200,
@@ -444,7 +1772,7 @@ class DatastreamEditorTest(TestCase):
     @responses.activate
     def test_edit_content_xml_datastream_post(self):
         responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams',
-                  body=test_data.DATASTREAMS_XML,
+                  body=datastream_profiles_xml([(ds_id, 'A') for ds_id in ['DC', 'RELS-EXT', 'rightsMetadata', 'MODS', 'irMetadata']]),
                   status=200,
                   content_type='text/xml'
                 )
@@ -460,11 +1788,123 @@ class DatastreamEditorTest(TestCase):
                     )
         url = reverse('repo_direct:xml-edit', kwargs={ 'pid': 'test:123', 'dsid': 'DC'})
         post_data = {'xml_content': test_data.DC_XML.format(PID='test:123')}
-        r = self.client.post(url, data=post_data,
-                **{
-                    'REMOTE_USER': 'x@brown.edu',
-                    'Shibboleth-eppn': 'x@brown.edu'
-                }
-        )
+        with patch('repo_direct_app.views.tempfile.NamedTemporaryFile') as mock_tempfile:
+            r = self.client.post(url, data=post_data,
+                    **{
+                        'REMOTE_USER': 'x@brown.edu',
+                        'Shibboleth-eppn': 'x@brown.edu'
+                    }
+            )
         self.assertRedirects(r, reverse('repo_direct:display', args=('test:123',)), fetch_redirect_response=False)
+        self.assertFalse(mock_tempfile.called)
+
+
+class UpstreamCallBudgetTest(UpstreamCallBudgetMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='x@brown.edu')
+        self.auth = {'REMOTE_USER': 'x@brown.edu', 'Shibboleth-eppn': 'x@brown.edu'}
+
+    def _add_fedora_responses(self, datastream_count):
+        ds_ids = ['DC', 'RELS-EXT', 'rightsMetadata', 'MODS', 'irMetadata'] + ['EXTRA%s' % i for i in range(datastream_count - 5)]
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123',
+                      body=test_data.OBJECT_XML,
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams',
+                      body=datastream_profiles_xml([(ds_id, 'A') for ds_id in ds_ids]),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MODS',
+                      body=test_data.DS_PROFILE_PATTERN.format(ds_id='MODS', ds_state='A'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/MODS/content',
+                      body='<mods:mods xmlns:mods="http://www.loc.gov/mods/v3"/>',
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.GET, 'http://testserver/fedora/objects/test:123/datastreams/RELS-EXT/content',
+                      body=test_data.RELS_EXT_XML.format(cmodel='audio'),
+                      status=200,
+                      content_type='text/xml'
+                    )
+        responses.add(responses.PUT, 'http://testserver/api/private/items/',
+                      body=json.dumps({}),
+                      status=200,
+                      content_type='application/json'
+                    )
+
+    @responses.activate
+    def test_display(self):
+        for datastream_count in [5, 500]:
+            cache.clear()
+            responses.reset()
+            self._add_fedora_responses(datastream_count)
+            with self.assertWithinCallBudget('display'):
+                r = self.client.get(reverse('repo_direct:display', kwargs={'pid': 'test:123'}), **self.auth)
+            self.assertEqual(r.status_code, 200)
+
+    @responses.activate
+    def test_xml_edit(self):
+        self._add_fedora_responses(50)
+        url = reverse('repo_direct:xml-edit', kwargs={'pid': 'test:123', 'dsid': 'MODS'})
+        with self.assertWithinCallBudget('xml_edit GET'):
+            r = self.client.get(url, **self.auth)
+        self.assertEqual(r.status_code, 200)
+        with self.assertWithinCallBudget('xml_edit POST'):
+            r = self.client.post(url, {'xml_content': '<mods:mods xmlns:mods="http://www.loc.gov/mods/v3"/>'}, **self.auth)
+        self.assertEqual(r.status_code, 302)
 
+    @responses.activate
+    def test_file_edit(self):
+        self._add_fedora_responses(500)
+        url = reverse('repo_direct:file-edit', kwargs={'pid': 'test:123', 'dsid': 'EXTRA1'})
+        with self.assertWithinCallBudget('file_edit POST'):
+            r = self.client.post(url, {'replacement_file': io.BytesIO(b'new content')}, **self.auth)
+        self.assertEqual(r.status_code, 302)
+
+    @responses.activate
+    def test_edit_item_collection(self):
+        self._add_fedora_responses(5)
+        responses.add(responses.GET, 'http://testserver/storage/test:123/irMetadata/',
+                      body=test_data.IR_METADATA_XML,
+                      status=200,
+                      content_type='text/xml'
+                    )
+        url = reverse('repo_direct:edit_item_collection', kwargs={'pid': 'test:123'})
+        with self.assertWithinCallBudget('edit_item_collection GET'):
+            r = self.client.get(url, **self.auth)
+        self.assertEqual(r.status_code, 200)
+        with self.assertWithinCallBudget('edit_item_collection POST'):
+            r = self.client.post(url, {'collection_ids': '1,2'}, **self.auth)
+        self.assertEqual(r.status_code, 302)
+        with self.assertWithinCallBudget('embargo POST'):
+            r = self.client.post(reverse('repo_direct:embargo', kwargs={'pid': 'test:123'}), {'new_embargo_end_year': 2030}, **self.auth)
+        self.assertEqual(r.status_code, 302)
+
+    @responses.activate
+    def test_reorder(self):
+        rows = ''.join(f'info:fedora/test:{i},{i}\n' for i in range(1, 10001))
+        responses.add(responses.GET, 'http://testserver/fedora/risearch', body=f'child,order\n{rows}', status=200, content_type='text/plain')
+        responses.add(responses.POST, 'http://testserver/api/private/reorder/', body='', status=200)
+        url = reverse('repo_direct:reorder', kwargs={'pid': 'test:123'})
+        new_order = [f'test:{i}' for i in range(2, 10001)] + ['test:1']
+        with self.assertWithinCallBudget('reorder POST'):
+            r = self.client.post(url, {'child_pids_ordered_list': ','.join(new_order)}, **self.auth)
+        self.assertEqual(r.status_code, 302)
+        with self.assertWithinCallBudget('reorder POST (full order)'), patch.object(settings, 'REORDER_ORDER_PREDICATE', None):
+            r = self.client.post(url, {'child_pids_ordered_list': ','.join(new_order)}, **self.auth)
+        self.assertEqual(r.status_code, 302)
+
+    @responses.activate
+    def test_budget_exceeded(self):
+        responses.add(responses.GET, 'http://testserver/storage/test:123/irMetadata/', body='', status=200)
+        with self.assertRaises(AssertionError):
+            with self.assertWithinCallBudget('edit_item_collection GET'):
+                http_client.storage_get('test:123', 'irMetadata')
+                http_client.storage_get('test:123', 'irMetadata')
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from . import app_settings as settings
+from . import http_client
+
+
+logger = logging.getLogger('ingest')
+
+_writes_since_eviction = 0
+_eviction_lock = threading.Lock()
+
+
+def _cache_paths(pid):
+    key = hashlib.sha1(pid.encode('utf8')).hexdigest()
+    directory = os.path.join(settings.THUMBNAIL_CACHE_DIR, key[:2])
+    return os.path.join(directory, f'{key}.img'), os.path.join(directory, f'{key}.json')
+
+
+def _read_metadata(metadata_path):
+    try:
+        with open(metadata_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_metadata(metadata_path, metadata):
+    _write_atomic(metadata_path, json.dumps(metadata).encode('utf8'))
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(max_bytes=None):
+    """Delete the least recently used thumbnails until the cache fits in max_bytes"""
+    max_bytes = max_bytes or settings.THUMBNAIL_CACHE_MAX_BYTES
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(settings.THUMBNAIL_CACHE_DIR):
+        for name in files:
+            if not name.endswith('.img'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return
+    #trim to 90% so we don't evict again on the next write
+    target = max_bytes * 0.9
+    for mtime, size, path in sorted(entries):
+        for stale_path in [path, path[:-len('.img')] + '.json']:
+            try:
+                os.unlink(stale_path)
+            except OSError:
+                pass
+        total -= size
+        if total <= target:
+            break
+
+
+def _maybe_evict():
+    global _writes_since_eviction
+    with _eviction_lock:
+        _writes_since_eviction += 1
+        if _writes_since_eviction < settings.THUMBNAIL_CACHE_EVICT_EVERY:
+            return
+        _writes_since_eviction = 0
+    try:
+        evict()
+    except Exception:
+        logger.exception('error evicting cached thumbnails')
+
+
+def get_thumbnail(pid):
+    """Return (image path, metadata) for a pid's thumbnail, or (None, None).
+
+    Thumbnails are kept on local disk; once THUMBNAIL_CACHE_REVALIDATE_AFTER has
+    passed they are revalidated upstream with If-None-Match/If-Modified-Since.
+    Reading a thumbnail bumps its mtime, which is what eviction goes by. A 404 is
+    remembered for THUMBNAIL_MISSING_CACHE_SECONDS, and drops any cached copy.
+    """
+    image_path, metadata_path = _cache_paths(pid)
+    metadata = _read_metadata(metadata_path)
+    now = time.time()
+    if metadata and metadata.get('missing'):
+        if now - metadata['checked'] < settings.THUMBNAIL_MISSING_CACHE_SECONDS:
+            return None, None
+        metadata = None
+    if metadata and not os.path.exists(image_path):
+        metadata = None
+    if metadata and now - metadata['checked'] < settings.THUMBNAIL_CACHE_REVALIDATE_AFTER:
+        _touch(image_path)
+        return image_path, metadata
+    headers = {}
+    if metadata:
+        if metadata.get('upstream_etag'):
+            headers['If-None-Match'] = metadata['upstream_etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+    try:
+        r = http_client.thumbnail_get(pid, headers=headers)
+    except Exception:
+        logger.exception(f'error fetching thumbnail for {pid}')
+        r = None
+    if r is not None and r.status_code == 304 and metadata:
+        metadata['checked'] = now
+        _write_metadata(metadata_path, metadata)
+        _touch(image_path)
+        return image_path, metadata
+    if r is not None and r.status_code == 404:
+        #no thumbnail (any more) - remember that for a while, and don't serve one we had
+        for stale_path in [image_path, metadata_path]:
+            try:
+                os.unlink(stale_path)
+            except OSError:
+                pass
+        _write_metadata(metadata_path, {'checked': now, 'missing': True})
+        return None, None
+    if r is not None and r.ok:
+        metadata = {
+            'checked': now,
+            'upstream_etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'content_type': r.headers.get('Content-Type', 'image/jpeg'),
+            'etag': '"%s"' % hashlib.md5(r.content).hexdigest(),
+        }
+        _write_atomic(image_path, r.content)
+        _write_metadata(metadata_path, metadata)
+        _maybe_evict()
+        return image_path, metadata
+    if metadata:
+        #upstream is failing - the old thumbnail is better than nothing
+        return image_path, metadata
+    return None, None
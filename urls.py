@@ -1,70 +1,105 @@
 from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
-from eulfedora import views as eulviews
 from . import app_settings as settings
 from . import views
+from .metrics import track_view
 
 
 app_name = 'repo_direct'
 urlpatterns = [
     url(
         regex= r'^$',
-        view = login_required(views.landing),
+        view = login_required(track_view(views.landing)),
         name = 'landing'
     ),
+    url(
+        regex= r'^metrics/$',
+        view = views.upstream_metrics,
+        name = 'metrics'
+    ),
+    url(
+        regex= r'^search/$',
+        view = login_required(track_view(views.object_search)),
+        name = 'search'
+    ),
     url(
         regex= r'^new/$',
-        view = login_required(views.new_object),
+        view = login_required(track_view(views.new_object)),
         name = 'new_object'
     ),
+    url(
+        regex= r'^bulk/new/$',
+        view = login_required(track_view(views.bulk_create_objects)),
+        name = 'bulk_create'
+    ),
+    url(
+        regex= r'^bulk/edit/$',
+        view = login_required(track_view(views.bulk_edit)),
+        name = 'bulk_edit'
+    ),
+    url(
+        regex= r'^thumbnails/(?P<pid>[^/]+)/$',
+        view = login_required(track_view(views.thumbnail)),
+        name = 'thumbnail'
+    ),
     url(
         regex= r'^(?P<pid>[^/]+)/$',
-        view = login_required(views.display),
+        view = login_required(track_view(views.display)),
         name = 'display'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/reorder/$',
-        view = login_required(views.reorder),
+        view = login_required(track_view(views.reorder)),
         name = 'reorder'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/edit/collection/$',
-        view = login_required(views.edit_item_collection),
+        view = login_required(track_view(views.edit_item_collection)),
         name = 'edit_item_collection'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/edit/embargo/$',
-        view = login_required(views.embargo),
+        view = login_required(track_view(views.embargo)),
         name = 'embargo'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/edit/create_stream/$',
-        view = login_required(views.create_stream),
+        view = login_required(track_view(views.create_stream)),
         name = 'create_stream'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/edit/add_content_file/$',
-        view = login_required(views.add_content_file),
+        view = login_required(track_view(views.add_content_file)),
         name = 'add_content_file'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/(?P<dsid>({}))/edit/$'.format('|'.join(settings.XML_DSIDS)),
-        view = login_required(views.xml_edit),
+        view = login_required(track_view(views.xml_edit)),
         name = 'xml-edit'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/(?P<dsid>[\w-]+)/edit/$',
-        view = login_required(views.file_edit),
+        view = login_required(track_view(views.file_edit)),
         name = 'file-edit'
     ),
+    url(
+        regex= r'^(?P<pid>[^/]+)/(?P<dsid>[\w-]+)/history/$',
+        view = login_required(track_view(views.datastream_history)),
+        name = 'datastream-history'
+    ),
+    url(
+        regex= r'^(?P<pid>[^/]+)/export/$',
+        view = login_required(track_view(views.export_zip)),
+        name = 'export'
+    ),
     url(
         regex= r'^(?P<pid>[^/]+)/AUDIT/$',
-        view = login_required(eulviews.raw_audit_trail),
+        view = login_required(track_view(views.audit)),
         name = 'audit'
     ),
     url(
         regex= r'^(?P<pid>[^/]+)/(?P<dsid>[\w-]+)/$',
-        view = login_required(eulviews.raw_datastream),
+        view = login_required(track_view(views.raw_datastream)),
         name = 'raw-datastream',
     ),
 
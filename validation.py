@@ -0,0 +1,55 @@
+import logging
+import threading
+from lxml import etree
+
+from . import app_settings as settings
+
+
+logger = logging.getLogger('ingest')
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+#lxml validators keep their error log on the schema object, so one validation at a time
+_validate_lock = threading.Lock()
+
+
+def _compile_schema(location):
+    schema_doc = etree.parse(location)
+    if location.endswith('.rng'):
+        return etree.RelaxNG(schema_doc)
+    return etree.XMLSchema(schema_doc)
+
+
+def get_schema(dsid):
+    """Compiled XSD/RelaxNG schema for a dsid, or None if it doesn't have one.
+
+    Schemas are compiled the first time they're needed and then kept for the life
+    of the process. If compiling fails, that's logged and the document is only
+    checked for well-formedness (compiling is tried again next time).
+    """
+    location = settings.XML_SCHEMAS.get(dsid)
+    if not location:
+        return None
+    with _schemas_lock:
+        if location not in _schemas:
+            try:
+                _schemas[location] = _compile_schema(location)
+            except (etree.XMLSchemaParseError, etree.RelaxNGParseError, etree.XMLSyntaxError, OSError):
+                logger.exception(f'error loading {dsid} schema from {location}')
+                return None
+        return _schemas[location]
+
+
+def validate_xml(dsid, xml_content):
+    """Return a list of error messages for xml_content - empty if it's valid"""
+    try:
+        doc = etree.fromstring(xml_content.encode('utf8'))
+    except etree.XMLSyntaxError as e:
+        return [f'XML is not well-formed: {e}']
+    schema = get_schema(dsid)
+    if schema is None:
+        return []
+    with _validate_lock:
+        if schema.validate(doc):
+            return []
+        return [f'line {error.line}: {error.message}' for error in schema.error_log]
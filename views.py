@@ -1,27 +1,66 @@
+import calendar
+import csv
+import hmac
 import json
 import logging
+import math
 import os
+import re
 import tempfile
+from functools import wraps
+import requests
 from django.core.mail import mail_admins
+from django.core.paginator import Paginator
+from django.db import IntegrityError
 from django.urls import reverse
 from django.contrib import messages
 from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
     HttpResponseRedirect,
     Http404,
     HttpResponseServerError,
+    JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from django.views.decorators.http import require_http_methods
-import requests
 from lxml.etree import XMLSyntaxError
-from eulfedora.server import Repository
-from eulfedora.models import XmlDatastreamObject
-from rdflib import URIRef
-from bdrcommon.resources import BDRResources
 from bdrcommon.identity import BDR_ADMIN, BDR_ACCESS
 
 from . import app_settings as settings
-from .models import BDR_Collection
+from . import clients
+from . import http_client
+from . import metrics
+from . import search_index
+from .bulk import parse_pid_rows, run_bulk
+from . import bulk_create
+from .export import stream_zip
+from .content_models import AUDIO_VIDEO, IMPLICIT_SET, get_capabilities
+from .models import BDR_Collection, StreamJob
+from .multipart import MultipartEncoder
+from .ordering import changed_order_pairs
+from .object_data import (
+        get_child_orders,
+        get_datastream_history,
+        get_datastream_profile,
+        get_datastream_profiles,
+        get_object_profile,
+        get_pretty_xml,
+        get_rels_ext,
+        has_usable_checksum,
+        invalidate_object,
+        load_datastream_profile,
+        parse_object_label,
+    )
+from .stream_jobs import create_stream_job, refresh_stream_jobs
+from .thumbnails import get_thumbnail
+from .upload_handlers import checksum_uploads
 from .forms import (
     RepoLandingForm,
     FileReplacementForm,
@@ -32,14 +71,39 @@ from .forms import (
     CreateStreamForm,
     AddContentFileForm,
     NewObjectForm,
+    BulkCreateForm,
+    BulkEditForm,
 )
 
 
-repo = Repository()
-bdr_server = BDRResources(settings.BDR_BASE)
 logger = logging.getLogger('ingest')
 
 
+def backend_degraded_page(view_func):
+    """Answer with a "backend degraded" page (503, with Retry-After) when an upstream's
+    circuit breaker is open, rather than an error page"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except http_client.BackendDegraded as e:
+            logger.warning(f'{view_func.__name__} for {request.user.username}: {e}')
+            retry_after = max(1, math.ceil(e.retry_after))
+            response = render(
+                    request,
+                    template_name='repo_direct/backend_degraded.html',
+                    context={
+                        'upstream': e.upstream.replace('_api', ' API').replace('_', ' '),
+                        'retry_after': retry_after,
+                        'was_write': request.method == 'POST',
+                    },
+                    status=503
+                )
+            response['Retry-After'] = retry_after
+            return response
+    return wrapper
+
+
 def landing(request):
     """Landing page for this repository interface"""
     form = RepoLandingForm(request.POST or None)
@@ -53,24 +117,40 @@ def landing(request):
     )
 
 
-def _post_new_object(form_cleaned_data):
-    params = {}
-    params['mods'] = json.dumps({'parameters': {'title': form_cleaned_data['title']}})
-    if 'collection_id' in form_cleaned_data:
-        params['ir'] = json.dumps({'parameters': {'ir_collection_id': form_cleaned_data['collection_id']}})
-    params['rights'] = json.dumps({'parameters': {'owner_id': BDR_ADMIN}})
-    r = requests.post(settings.ITEM_POST_URL, data=params)
-    if r.ok:
-        return r.json()['pid']
-    else:
-        raise Exception(f'error posting new object: {r.status_code} - {r.content.decode("utf8")}')
+@require_http_methods(['GET'])
+def object_search(request):
+    """Type-ahead matches for the landing page, from the local search index"""
+    text = request.GET.get('q', '').strip()
+    results = search_index.search(text) if len(text) >= 2 else []
+    return JsonResponse({'results': results})
+
+
+def audit(request, pid):
+    """eulfedora's audit trail view - imported here so eulfedora only loads when it's used"""
+    from eulfedora.views import raw_audit_trail
+    return raw_audit_trail(request, pid)
+
+
+@require_http_methods(['GET'])
+def upstream_metrics(request):
+    """Upstream call counts & latencies, for Prometheus to scrape with the metrics token
+    (or for staff to look at)"""
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    token_ok = (bool(settings.METRICS_TOKEN) and scheme == 'Bearer'
+                and hmac.compare_digest(token.encode('utf8'), settings.METRICS_TOKEN.encode('utf8')))
+    if not (token_ok or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
+@backend_degraded_page
 def new_object(request):
     if request.method == 'POST':
         form = NewObjectForm(request.POST)
         if form.is_valid():
-            pid = _post_new_object(form.cleaned_data)
+            collection_id = form.cleaned_data['collection_id']
+            pid = bulk_create.post_new_object(form.cleaned_data['title'], collection_id)
+            search_index.index_object(pid, title=form.cleaned_data['title'], collection_ids=[collection_id] if collection_id else [])
             logger.info(f'{request.user.username} created new object {pid}')
             messages.info(request, f'New object {pid} created')
             return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
@@ -83,40 +163,36 @@ def new_object(request):
         )
 
 
-def _audio_video_obj(obj):
-    av_content_models = [
-                'info:fedora/bdr-cmodel:audio',
-                'info:fedora/bdr-cmodel:video',
-                'info:fedora/bdr-cmodel:audioMaster',
-                'info:fedora/bdr-cmodel:aiff',
-                'info:fedora/bdr-cmodel:wav',
-                'info:fedora/bdr-cmodel:mp3',
-                'info:fedora/bdr-cmodel:mp4',
-                'info:fedora/bdr-cmodel:m4v',
-                'info:fedora/bdr-cmodel:mov',
-            ]
-    for cm in av_content_models:
-        if obj.has_model(cm):
-            return True
-    return False
-
-
 def display(request, pid):
-    obj = repo.get_object(pid, create=False)
-    if not obj.exists:
-        raise Http404
-    template_info = {'obj': obj}
-    if _audio_video_obj(obj):
+    #the profile, RELS-EXT & datastream profiles don't depend on each other, so fetch them together
+    from eulfedora.util import RequestFailed #eulfedora is only imported when needed - see clients.py
+    object_profile = http_client.submit(lambda: get_object_profile(clients.get_repo(), pid))
+    rels_ext = http_client.submit(lambda: get_rels_ext(clients.get_repo(), pid))
+    profiles = http_client.submit(lambda: get_datastream_profiles(clients.get_repo(), pid))
+    try:
+        search_index.index_object(pid, title=parse_object_label(object_profile.result()))
+    except RequestFailed as e:
+        if e.code == 404:
+            raise Http404
+        raise
+    capabilities = get_capabilities(pid, rels_ext.result())
+    template_info = {'pid': pid}
+    if AUDIO_VIDEO in capabilities:
         template_info['audio_video_obj'] = True
-    implicit_set_cmodel = 'info:fedora/bdr-cmodel:implicit-set'
-    if obj.has_model(implicit_set_cmodel):
+    if IMPLICIT_SET in capabilities:
         template_info['obj_type'] = 'implicit-set'
     else:
         template_info['obj_type'] = ''
-    datastreams = [ds for ds in obj.ds_list.keys() if obj.getDatastreamObject(ds).state == 'A']
-    deleted_datastreams = [ds for ds in obj.ds_list.keys() if obj.getDatastreamObject(ds).state == 'D']
+    profiles = profiles.result().values()
+    datastreams = [profile for profile in profiles if profile.state == 'A']
+    deleted_datastreams = [profile for profile in profiles if profile.state == 'D']
     template_info['datastreams'] = datastreams
     template_info['deleted_datastreams'] = deleted_datastreams
+    stream_jobs = list(StreamJob.objects.filter(pid=pid)[:5])
+    if any(job.is_in_flight and job.due_for_check() for job in stream_jobs):
+        refresh_stream_jobs(pid)
+        stream_jobs = list(StreamJob.objects.filter(pid=pid)[:5])
+    template_info['stream_jobs'] = stream_jobs
     return render(
         request,
         template_name='repo_direct/display.html',
@@ -124,23 +200,62 @@ def display(request, pid):
     )
 
 
+def _get_bdr_item(pid):
+    return metrics.timed_call('bdr_api', 'item.get', clients.get_bdr_server().item.get, pid, identities=[BDR_ADMIN])
+
+
+def _current_child_orders(pid):
+    """Children's orders straight from Fedora, or None if they can't be read"""
+    from eulfedora.util import RequestFailed
+    if not settings.REORDER_ORDER_PREDICATE:
+        return None
+    try:
+        return get_child_orders(clients.get_repo(), pid, settings.REORDER_ORDER_PREDICATE)
+    except (RequestFailed, requests.RequestException) as e:
+        logger.warning(f'reorder {pid}: sending the full order - could not read the current orders: {e}')
+        return None
+
+
+def _reorder_pairs(pid, child_pids_ordered_list):
+    """Only send the children whose order changed, unless the full order is needed -
+    the current orders have to come from Fedora, so the diff isn't against stale data"""
+    full_order = [(value, str(index+1)) for index, value in enumerate(child_pids_ordered_list)]
+    if settings.REORDER_SEND_FULL_ORDER:
+        return full_order
+    current_orders = _current_child_orders(pid)
+    if current_orders is None:
+        return full_order
+    pairs = changed_order_pairs(current_orders, child_pids_ordered_list)
+    if pairs is None:
+        logger.warning(f'reorder {pid}: sending the full order - the {len(current_orders)} orders in Fedora don\'t match the {len(child_pids_ordered_list)} children')
+        return full_order
+    return pairs
+
+
+@backend_degraded_page
 def reorder(request, pid):
     form = ReorderForm(request.POST or None)
     if request.method == 'POST':
         if form.is_valid():
             child_pids_ordered_list = form.cleaned_data['child_pids_ordered_list'].split(',')
-            pairs_param_for_api = json.dumps([(value, str(index+1)) for index, value in enumerate(child_pids_ordered_list)])
-            r = requests.post(settings.REORDER_URL, data={'parent_pid': pid, 'child_pairs': pairs_param_for_api})
+            pairs = _reorder_pairs(pid, child_pids_ordered_list)
+            if not pairs:
+                messages.info(request, 'The order was not changed')
+                return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
+            pairs_param_for_api = json.dumps(pairs)
+            r = http_client.reorder_api_post({'parent_pid': pid, 'child_pairs': pairs_param_for_api})
             if r.ok:
+                for changed_pid in [pid] + [child_pid for child_pid, order in pairs]:
+                    invalidate_object(changed_pid)
                 messages.info(request, 'New order has been submitted (allow a bit of time for the changes to appear)')
                 return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
             else:
                 raise Exception('error submitting new order')
-    bdr_item = bdr_server.item.get(pid, identities=[BDR_ADMIN])
+    bdr_item = _get_bdr_item(pid)
     item_data = bdr_item.data
     children = bdr_item.data['relations']['hasPart'] #[] if item has no children
     for child in children:
-        child['thumbnail_url'] = '%s/%s/' % (settings.THUMBNAIL_BASE_URL, child['pid'])
+        child['thumbnail_url'] = reverse('repo_direct:thumbnail', args=(child['pid'],))
         child['studio_url'] = '%s/%s/' % (settings.STUDIO_ITEM_URL, child['pid'])
     return render(
         request,
@@ -154,6 +269,28 @@ def reorder(request, pid):
     )
 
 
+@require_http_methods(['GET', 'HEAD'])
+def thumbnail(request, pid):
+    """Serve a thumbnail from the local cache, so reorder pages don't re-render
+    every child's thumbnail on the viewer service"""
+    image_path, metadata = get_thumbnail(pid)
+    if image_path is None:
+        raise Http404
+    not_modified = get_conditional_response(request, etag=metadata['etag'])
+    if not_modified is None:
+        try:
+            image_file = open(image_path, 'rb')
+        except OSError: #evicted in the meantime
+            raise Http404
+        response = FileResponse(image_file, content_type=metadata['content_type'])
+    else:
+        response = not_modified
+    response['ETag'] = metadata['etag']
+    response['Cache-Control'] = f'private, max-age={settings.THUMBNAIL_BROWSER_MAX_AGE}'
+    return response
+
+
+@backend_degraded_page
 def edit_item_collection(request, pid):
     if request.method == 'POST':
         form = ItemCollectionsForm(request.POST)
@@ -166,6 +303,7 @@ def edit_item_collection(request, pid):
             return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
     else:
         form = ItemCollectionsForm.from_storage_data(pid)
+        search_index.index_object(pid, collection_ids=form.data['collection_ids'].split(','))
     return render(
             request,
             template_name='repo_direct/edit_item_collection.html',
@@ -177,13 +315,15 @@ def _post_embargo_year_to_api(pid, year):
     params = {'pid': pid}
     embargo_end = f'{year}-06-01T00:00:01Z'
     params['rels'] = json.dumps({'embargo_end': embargo_end})
-    r = requests.put(settings.ITEM_POST_URL, data=params)
+    r = http_client.item_api_put(params, idempotent=True)
     if not r.ok:
         err_msg = 'error saving new embargo end year:\n'
         err_msg += f'{r.status_code} - {r.text}'
         raise Exception(err_msg)
+    invalidate_object(pid)
 
 
+@backend_degraded_page
 def embargo(request, pid):
     if request.method == 'POST':
         form = EmbargoForm(request.POST)
@@ -203,20 +343,36 @@ def embargo(request, pid):
 def _queue_stream_job(pid, visibility):
     params = {'pid': pid}
     params['generate_derivatives'] = json.dumps({'stream': {'rights': visibility}})
-    r = requests.put(settings.ITEM_POST_URL, data=params)
+    r = http_client.item_api_put(params)
     if not r.ok:
         err_msg = 'error requesting stream job to be queued:\n'
         err_msg += f'{r.status_code} - {r.text}'
         raise Exception(err_msg)
+    invalidate_object(pid)
 
 
+@backend_degraded_page
 def create_stream(request, pid):
     if request.method == 'POST':
         form = CreateStreamForm(request.POST)
         if form.is_valid():
-            _queue_stream_job(pid, visibility=form.cleaned_data['visibility'])
-            messages.info(request, 'Queued streaming derivative job.')
-            return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
+            visibility = form.cleaned_data['visibility']
+            try:
+                job = create_stream_job(pid, visibility, request.user.username, supersede=form.cleaned_data['submit_anyway'])
+            except IntegrityError: #one_in_flight_stream_job_per_pid - a concurrent submission got there first
+                job = None
+            if job is None:
+                form.add_error(None, 'A streaming derivative job for this object is already in progress - check "Submit anyway" to queue another one.')
+            else:
+                try:
+                    _queue_stream_job(pid, visibility=visibility)
+                except Exception as e:
+                    job.status = StreamJob.FAILED
+                    job.status_detail = str(e)
+                    job.save()
+                    raise
+                messages.info(request, 'Queued streaming derivative job.')
+                return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
     else:
         form = CreateStreamForm()
     return render(
@@ -226,39 +382,69 @@ def create_stream(request, pid):
         )
 
 
-def _post_content_file(pid, dsid, content_file, overwrite=False):
+def _post_content_file(pid, dsid, content_file, overwrite=False, checksum=None, file_name=None):
+    """content_file is an uploaded file, a file object, or bytes/a memoryview (sent
+    without being copied - give its file_name). checksum is a (checksum type,
+    checksum) for the API to use instead of computing its own."""
     params = {'pid': pid}
     if overwrite:
         params['overwrite_content'] = 'yes'
-    content_stream = {'file_name': content_file.name}
+    file_name = file_name or content_file.name
+    content_stream = {'file_name': file_name}
     if dsid:
         content_stream['dsID'] = dsid
+    if checksum:
+        content_stream['checksumType'], content_stream['checksum'] = checksum
     #handle larger files that get written to a tmp directory
     if hasattr(content_file, 'temporary_file_path'):
         file_path = content_file.temporary_file_path()
         os.chmod(file_path, 0o644)
         content_stream['path'] = file_path
         params['content_streams'] = json.dumps([content_stream])
-        r = requests.put(settings.ITEM_POST_URL, data=params)
-    else: #handle smaller in-memory files
+        r = http_client.item_api_put(params)
+    else: #handle smaller in-memory files - streamed in chunks, not built up in memory
         params['content_streams'] = json.dumps([content_stream])
-        files = {content_file.name: content_file}
-        r = requests.put(settings.ITEM_POST_URL, data=params, files=files)
+        encoder = MultipartEncoder(fields=params, files=[(file_name, content_file)])
+        r = http_client.item_api_put_multipart(encoder)
+    if r.ok:
+        invalidate_object(pid)
     return r
 
 
+def _upload_unchanged(pid, dsid, checksums, cached_profile):
+    """True if the datastream already has the uploaded content - the cached profile
+    could be out of date, so a match is confirmed with Fedora before the write is
+    skipped, and any doubt means writing"""
+    from eulfedora.util import RequestFailed
+    if not (checksums and checksums.matches(cached_profile)):
+        return False
+    try:
+        return checksums.matches(load_datastream_profile(clients.get_repo(), pid, dsid))
+    except RequestFailed:
+        return False
+
+
+@checksum_uploads
+@backend_degraded_page
 def add_content_file(request, pid):
     if request.method == 'POST':
         form = AddContentFileForm(request.POST, request.FILES)
         if form.is_valid():
             content_file = request.FILES['content_file']
+            checksums = request.upload_checksums.get('content_file')
+            profile = None
             if form.cleaned_data['is_thumbnail']:
                 dsid = 'thumbnail'
                 info_msg = 'Added thumbnail'
+                profile = get_datastream_profiles(clients.get_repo(), pid).get(dsid)
+                if _upload_unchanged(pid, dsid, checksums, profile):
+                    messages.info(request, 'The uploaded thumbnail is identical to the current one - nothing was changed.')
+                    return HttpResponseRedirect(reverse('repo_direct:display', args=(pid,)))
             else:
                 dsid = None
                 info_msg = 'Added content'
-            r = _post_content_file(pid, dsid=dsid, content_file=content_file)
+            checksum = checksums.for_profile(profile) if checksums else None
+            r = _post_content_file(pid, dsid=dsid, content_file=content_file, checksum=checksum)
             if not r.ok:
                 err_msg = f'error saving content\n'
                 err_msg += f'{r.status_code} - {r.text}'
@@ -280,11 +466,12 @@ def rights_edit(request, pid, dsid):
         new_rights = form.build_rights()
         params = {'pid': pid}
         params['rights'] = json.dumps({'xml_data': new_rights.serialize().decode('utf8')})
-        r = requests.put(settings.ITEM_POST_URL, data=params)
+        r = http_client.item_api_put(params)
         if not r.ok:
             err_msg = f'error saving {dsid} content\n'
             err_msg += f'{r.status_code} - {r.text}'
             return HttpResponseServerError(err_msg)
+        invalidate_object(pid)
         messages.info(request, 'The sharing setting for %s have changed' % (pid,), extra_tags='text-info' )
         return HttpResponseRedirect(reverse("repo_direct:display", args=(pid,)))
     return render(
@@ -309,11 +496,122 @@ def update_ir_data(pid, collections):
     #   a list of IDs.
     folders_param = _get_folders_param_from_collections(collections)
     params['ir'] = json.dumps({'parameters': {'folders': folders_param}})
-    r = requests.put(settings.ITEM_POST_URL, data=params)
+    r = http_client.item_api_put(params, idempotent=True)
     if not r.ok:
         err_msg = 'error saving new collections information:\n'
         err_msg += f'{r.status_code} - {r.text}'
         raise Exception(err_msg)
+    invalidate_object(pid)
+    search_index.index_object(pid, collection_ids=collections)
+
+
+def _bulk_edit_pid(action, pid, value):
+    if not value:
+        raise Exception('no value given')
+    if action == 'embargo':
+        #same validation as the single-object embargo form
+        form = EmbargoForm({'new_embargo_end_year': value})
+        if not form.is_valid():
+            raise Exception(f'invalid embargo end year "{value}": {" ".join(form.errors["new_embargo_end_year"])}')
+        _post_embargo_year_to_api(pid, form.cleaned_data['new_embargo_end_year'])
+    elif action == 'collections':
+        update_ir_data(pid, value.split(','))
+    else:
+        raise Exception(f'unknown action {action}')
+
+
+def _run_bulk_edit(action, rows, default_value):
+    jobs = [(pid, (action, pid, value or default_value)) for pid, value in rows]
+    return run_bulk(_bulk_edit_pid, jobs)
+
+
+class _Echo(object):
+    """file-like object for csv.writer that just hands back each line"""
+    def write(self, value):
+        return value
+
+
+def _bulk_edit_csv_report(results):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['pid', 'result', 'error'])
+    for pid, error in results:
+        yield writer.writerow([pid, 'failed' if error else 'ok', error or ''])
+
+
+def _bulk_edit_json_lines(results):
+    for pid, error in results:
+        yield json.dumps({'pid': pid, 'ok': error is None, 'error': error}) + '\n'
+
+
+def _bulk_create_csv_report(results):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(bulk_create.REPORT_COLUMNS)
+    for row, result in results:
+        yield writer.writerow(bulk_create.report_row(row, result))
+
+
+def bulk_create_objects(request):
+    """Create an object per CSV row, streaming back a CSV report row as each one is done"""
+    if request.method == 'POST':
+        form = BulkCreateForm(request.POST, request.FILES)
+        if form.is_valid():
+            content = form.cleaned_data['csv_file'].read()
+            try:
+                rows = bulk_create.parse_create_rows(content)
+            except (ValueError, UnicodeDecodeError) as e:
+                form.add_error('csv_file', str(e))
+            else:
+                batch = bulk_create.batch_id_for(content)
+                results = bulk_create.run_batch(batch, rows, request.user.username, retry_interrupted=form.cleaned_data['retry_interrupted'])
+                response = StreamingHttpResponse(_bulk_create_csv_report(results), content_type='text/csv')
+                response['Content-Disposition'] = f'attachment; filename="bulk_create_{batch[:12]}.csv"'
+                return response
+    else:
+        form = BulkCreateForm()
+    return render(
+            request,
+            template_name='repo_direct/bulk_create.html',
+            context={'form': form}
+        )
+
+
+@backend_degraded_page
+def bulk_edit(request):
+    """Change embargo years or collection IDs for many pids at once.
+
+    Form posts get a CSV report streamed back; JSON posts ({"action": ..., "value": ...,
+    "pids": [...]}) get one JSON line per pid. Either way, each row is sent as soon
+    as that pid's write finishes.
+    """
+    if request.method == 'POST':
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body.decode('utf8'))
+                action = data['action']
+                rows = [(pid, None) for pid in data['pids']]
+            except (ValueError, KeyError, TypeError) as e:
+                return HttpResponseBadRequest(f'invalid bulk edit request: {e}')
+            if action not in dict(BulkEditForm.ACTION_CHOICES):
+                return HttpResponseBadRequest(f'invalid bulk edit action: {action}')
+            logger.info(f'{request.user.username} started bulk {action} for {len(rows)} pids')
+            results = _run_bulk_edit(action, rows, str(data.get('value', '')))
+            return StreamingHttpResponse(_bulk_edit_json_lines(results), content_type='application/x-ndjson')
+        form = BulkEditForm(request.POST, request.FILES)
+        if form.is_valid():
+            rows = parse_pid_rows(form.cleaned_data['pids'], form.cleaned_data['pids_file'])
+            action = form.cleaned_data['action']
+            logger.info(f'{request.user.username} started bulk {action} for {len(rows)} pids')
+            results = _run_bulk_edit(action, rows, form.cleaned_data['value'])
+            response = StreamingHttpResponse(_bulk_edit_csv_report(results), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="bulk_edit_results.csv"'
+            return response
+    else:
+        form = BulkEditForm()
+    return render(
+            request,
+            template_name='repo_direct/bulk_edit.html',
+            context={'form': form}
+        )
 
 
 def ir_edit(request, pid, dsid):
@@ -343,13 +641,20 @@ def ir_edit(request, pid, dsid):
     )
 
 
+@checksum_uploads
+@backend_degraded_page
 def file_edit(request, pid, dsid):
     form = FileReplacementForm(request.POST or None, request.FILES or None)
     if form.is_valid():
-        obj = repo.get_object(pid,create=False)
-        if dsid in obj.ds_list:
+        profile = get_datastream_profiles(clients.get_repo(), pid).get(dsid)
+        checksums = request.upload_checksums.get('replacement_file')
+        if profile and _upload_unchanged(pid, dsid, checksums, profile):
+            #identical content - rewriting it would only re-trigger storage writes & derivatives
+            messages.info(request, f'The uploaded file is identical to the current {dsid} content - nothing was changed.')
+        elif profile:
             uploaded_file = request.FILES['replacement_file']
-            r = _post_content_file(pid, dsid=dsid, content_file=uploaded_file, overwrite=True)
+            checksum = checksums.for_profile(profile) if checksums else None
+            r = _post_content_file(pid, dsid=dsid, content_file=uploaded_file, overwrite=True, checksum=checksum)
             if not r.ok:
                 err_msg = f'error saving {dsid} content\n'
                 err_msg += f'{r.status_code} - {r.text}'
@@ -373,11 +678,11 @@ def file_edit(request, pid, dsid):
 
 
 @require_http_methods(['GET', 'POST'])
+@backend_degraded_page
 def xml_edit(request, pid, dsid):
     request.encoding = 'utf-8'
-    obj = repo.get_object(pid)
     if request.method == "POST":
-        form = EditXMLForm(request.POST)
+        form = EditXMLForm(request.POST, dsid=dsid)
         if form.is_valid():
             xml_content = u"%s" % form.cleaned_data['xml_content']
             if dsid in ['MODS', 'rightsMetadata', 'irMetadata', 'RELS-INT', 'RELS-EXT']:
@@ -392,19 +697,24 @@ def xml_edit(request, pid, dsid):
                     params['rels'] = json.dumps({'xml_data': xml_content})
                 elif dsid == 'RELS-INT':
                     params['rels_int'] = json.dumps({'xml_data': xml_content})
-                r = requests.put(settings.ITEM_POST_URL, data=params)
+                r = http_client.item_api_put(params)
                 if not r.ok:
                     err_msg = f'error saving {dsid} content\n'
                     err_msg += f'{r.status_code} - {r.text}'
                     logger.error(err_msg)
                     raise Exception(err_msg)
+                invalidate_object(pid)
             else:
-                if dsid in obj.ds_list:
-                    with tempfile.NamedTemporaryFile(prefix=dsid, suffix='.xml', delete=True, mode='w+b') as f:
-                        f.write(xml_content.encode('utf8'))
-                        f.flush()
-                        f.seek(0)
-                        r = _post_content_file(pid, dsid=dsid, content_file=f, overwrite=True)
+                if dsid in get_datastream_profiles(clients.get_repo(), pid):
+                    xml_bytes = xml_content.encode('utf8')
+                    if len(xml_bytes) <= settings.XML_EDIT_MAX_IN_MEMORY_SIZE:
+                        r = _post_content_file(pid, dsid=dsid, content_file=memoryview(xml_bytes), overwrite=True, file_name=f'{dsid}.xml')
+                    else:
+                        with tempfile.NamedTemporaryFile(prefix=dsid, suffix='.xml', delete=True, mode='w+b') as f:
+                            f.write(xml_bytes)
+                            f.flush()
+                            f.seek(0)
+                            r = _post_content_file(pid, dsid=dsid, content_file=f, overwrite=True)
                     if not r.ok:
                         err_msg = f'error saving content\n'
                         err_msg += f'{r.status_code} - {r.text}'
@@ -417,10 +727,28 @@ def xml_edit(request, pid, dsid):
             messages.info(request, f'{dsid} datastream updated')
             return HttpResponseRedirect(reverse("repo_direct:display", args=(pid,)))
     elif request.method == 'GET':
-        if dsid in obj.ds_list:
-            datastream_obj = obj.getDatastreamObject(dsid, XmlDatastreamObject)
+        from eulfedora.util import RequestFailed
+        try:
+            #not cached: it keys the pretty XML, and an out of date key would open old content for editing
+            profile = load_datastream_profile(clients.get_repo(), pid, dsid)
+        except RequestFailed as e:
+            if e.code != 404:
+                raise
+            profile = None
+        if profile:
+            if (profile.size or 0) > settings.XML_EDIT_MAX_INLINE_SIZE and request.GET.get('mode') != 'full':
+                return render(
+                    request,
+                    template_name='repo_direct/xml_view_large.html',
+                    context={
+                        'pid': pid,
+                        'dsid': dsid,
+                        'profile': profile,
+                        'chunk_size': settings.XML_VIEW_CHUNK_SIZE,
+                    }
+                )
             try:
-                xml_content = datastream_obj.content.serialize(pretty=True).decode('utf8')
+                xml_content = get_pretty_xml(clients.get_repo(), pid, profile)
             except XMLSyntaxError as e:
                 import traceback
                 subject = 'error parsing XML for %s %s' % (pid, dsid)
@@ -429,7 +757,7 @@ def xml_edit(request, pid, dsid):
                 return HttpResponseServerError('couldn\'t load XML - may be invalid. BDR has been notified.')
         else:
             xml_content = 'No datastream found'
-        form = EditXMLForm({'xml_content': xml_content})
+        form = EditXMLForm(initial={'xml_content': xml_content}, dsid=dsid)
     return render(
         request,
         template_name='repo_direct/edit.html',
@@ -440,3 +768,211 @@ def xml_edit(request, pid, dsid):
         }
     )
 
+
+@require_http_methods(['GET'])
+def datastream_history(request, pid, dsid):
+    """Paginated list of a datastream's versions - content is only loaded when a
+    version's link is followed"""
+    from eulfedora.util import RequestFailed
+    try:
+        history = get_datastream_history(clients.get_repo(), pid, dsid)
+    except RequestFailed as e:
+        if e.code == 404:
+            raise Http404
+        raise
+    page = Paginator(history, settings.HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(
+        request,
+        template_name='repo_direct/datastream_history.html',
+        context={
+            'pid': pid,
+            'dsid': dsid,
+            'page': page,
+            'version_count': len(history),
+        }
+    )
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(range_header, size):
+    """Return (start, end) for a single byte range, None if the header should be
+    ignored (missing, malformed or a multi-range request), or 'unsatisfiable'."""
+    match = RANGE_RE.match(range_header.strip()) if range_header else None
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if not match.group(1):
+        suffix_length = int(match.group(2))
+        if suffix_length == 0:
+            return 'unsatisfiable'
+        return (max(size - suffix_length, 0), size - 1)
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return (start, min(end, size - 1))
+
+
+def _datastream_etag(profile):
+    if has_usable_checksum(profile):
+        return f'"{profile.checksum}"'
+    return None
+
+
+def _datastream_last_modified(profile):
+    created = parse_datetime(profile.created or '')
+    if created:
+        return calendar.timegm(created.utctimetuple())
+    return None
+
+
+def _stream_content(fedora_response, skip=0, length=None):
+    """Yield datastream content from fedora, dropping the first skip bytes and
+    stopping after length bytes (for when fedora ignored our Range header)."""
+    try:
+        for chunk in fedora_response.iter_content(settings.DOWNLOAD_CHUNK_SIZE):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            if length is not None:
+                if len(chunk) >= length:
+                    yield chunk[:length]
+                    return
+                length -= len(chunk)
+            yield chunk
+    finally:
+        fedora_response.close()
+
+
+@require_http_methods(['GET', 'HEAD'])
+def raw_datastream(request, pid, dsid):
+    """Stream datastream content from Fedora, with Range and conditional GET support.
+
+    The ETag and Last-Modified come from the datastream profile (dsChecksum and
+    dsCreateDate), so unchanged content is answered with a 304 before Fedora is
+    asked for any content. An asOfDateTime parameter (eg. a dsCreateDate from the
+    history page) gets the version that was current then.
+    """
+    from eulfedora.util import RequestFailed
+    as_of = None
+    if request.GET.get('asOfDateTime'):
+        try:
+            as_of = parse_datetime(request.GET['asOfDateTime'])
+        except ValueError:
+            as_of = None
+        if as_of is None or as_of.tzinfo is None:
+            return HttpResponseBadRequest('asOfDateTime should be a date-time with a timezone, eg. 2020-01-01T00:00:00.000Z')
+    try:
+        if as_of:
+            #an old version doesn't change, so its cached profile can't be out of date
+            profile = get_datastream_profile(clients.get_repo(), pid, dsid, as_of=as_of)
+        else:
+            #the content can change without going through repo_direct (eg. a derivative job), so the
+            #  profile the validators, size & ranges come from is always Fedora's current one
+            profile = load_datastream_profile(clients.get_repo(), pid, dsid)
+    except RequestFailed as e:
+        if e.code == 404:
+            raise Http404
+        raise
+    etag = _datastream_etag(profile)
+    last_modified = _datastream_last_modified(profile)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    size = profile.size or None
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range in (etag, http_date(last_modified) if last_modified else None)):
+        if size:
+            byte_range = _parse_range(range_header, size)
+            if byte_range == 'unsatisfiable':
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        else:
+            #size unknown (eg. Fedora didn't record it) - let Fedora handle the range
+            byte_range = range_header
+
+    if request.method == 'HEAD':
+        response = HttpResponse()
+        if size:
+            response['Content-Length'] = size
+    else:
+        rqst_headers = {}
+        if isinstance(byte_range, tuple):
+            rqst_headers['Range'] = 'bytes=%s-%s' % byte_range
+        elif byte_range:
+            rqst_headers['Range'] = byte_range
+        fedora_response = clients.get_repo().api.getDatastreamDissemination(pid, dsid, asOfDateTime=as_of, stream=True, rqst_headers=rqst_headers)
+        if isinstance(byte_range, tuple):
+            start, end = byte_range
+            if fedora_response.status_code == 206:
+                content = _stream_content(fedora_response)
+            else:
+                content = _stream_content(fedora_response, skip=start, length=end - start + 1)
+            response = StreamingHttpResponse(content, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = StreamingHttpResponse(_stream_content(fedora_response), status=fedora_response.status_code)
+            for header in ['Content-Range', 'Content-Length']:
+                if header in fedora_response.headers:
+                    response[header] = fedora_response.headers[header]
+    response['Content-Type'] = profile.mimetype or 'application/octet-stream'
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if as_of:
+        #an old version never changes
+        response['Cache-Control'] = f'private, max-age={settings.RAW_DATASTREAM_VERSION_MAX_AGE}'
+    return response
+
+
+def _export_content(pid, profile):
+    try:
+        fedora_response = clients.get_repo().api.getDatastreamDissemination(pid, profile.dsid, stream=True)
+        yield from _stream_content(fedora_response)
+    except Exception:
+        #the headers are gone already - raising is what aborts the download, so the
+        #  client doesn't get a 200 with an archive that's missing content
+        logger.exception(f'export of {pid} failed at {profile.dsid}')
+        raise
+
+
+def _export_entries(pid, profiles):
+    #each datastream is only requested from Fedora when the archive gets to it
+    with metrics.view_context('export_zip'):
+        for profile in profiles:
+            yield profile, _export_content(pid, profile)
+
+
+@require_http_methods(['GET'])
+def export_zip(request, pid):
+    """Stream a ZIP of an object's active datastreams (or the dsid parameters), with a
+    manifest of checksums - the download starts as soon as the first datastream does."""
+    from eulfedora.util import RequestFailed
+    try:
+        datastreams = get_datastream_profiles(clients.get_repo(), pid)
+    except RequestFailed as e:
+        if e.code == 404:
+            raise Http404
+        raise
+    dsids = list(dict.fromkeys(request.GET.getlist('dsid')))
+    unknown = [dsid for dsid in dsids if dsid not in datastreams]
+    if unknown:
+        return HttpResponseBadRequest(f'no datastream {", ".join(unknown)} in {pid}')
+    if dsids:
+        profiles = [datastreams[dsid] for dsid in dsids]
+    else:
+        profiles = [profile for profile in datastreams.values() if profile.state == 'A']
+    response = StreamingHttpResponse(stream_zip(_export_entries(pid, profiles)), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="%s.zip"' % pid.replace(':', '_')
+    return response